@@ -0,0 +1,565 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Todoist, GitHub, Google Calendar and ecoharmonogram endpoints the pipelines use.
+
+Every upstream is served from one HTTP server on its real paths, so pointing WRIKE_TODOIST_API_ENDPOINT
+at it redirects the whole CLI. The data is generated with the seeded generators of payloads.py and
+mutations through the Todoist Sync API are applied to it, deduplicated by command uuid like upstream.
+Latency, error rate and a per-upstream rate limit (with X-RateLimit-* and Retry-After headers) are
+configurable. Requests are counted per endpoint and served as JSON from /_stats.
+
+    python benchmarks/fake_api.py [--port 8765] [--dataset-size 1000] [--latency-ms 50] [--error-rate 0.01]
+"""
+import collections
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import payloads  # noqa: E402
+
+# Hosts the clients believe they talk to, used in the Link headers so followed pages are redirected too
+UPSTREAM_HOSTS = {
+    "todoist": "https://api.todoist.com",
+    "github": "https://api.github.com",
+    "google": "https://www.googleapis.com",
+    "harmonogram": "https://api.ecoharmonogram.pl",
+}
+PROJECTS = {"Calendar": "p-calendar", "Śmieci": "p-harmonogram", "GitHub": "p-github"}
+TODOIST_PAGE_SIZE = 200
+CALENDAR_PAGE_SIZE = 250
+GRAPHQL_PAGE_SIZE = 100
+
+
+class FakeApiOptions(NamedTuple):
+    dataset_size: int = 100
+    seed: int = 0
+    latency: float = 0.0  # seconds added to every response
+    error_rate: float = 0.0  # share of requests answered with 503
+    rate_limit: int = 0  # requests per upstream and window, 0 disables the limit
+    rate_limit_window: float = 60.0
+
+
+class FakeResponse(NamedTuple):
+    status: int
+    body: Optional[object] = None
+    headers: Dict[str, str] = {}
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+class FakeDataset:
+    """Mutable state behind the fake endpoints, guarded by one lock."""
+
+    def __init__(self, options: FakeApiOptions):
+        size, seed = options.dataset_size, options.seed
+        self.lock = threading.Lock()
+        self.today = datetime.date.today()
+
+        self.github_user = payloads.github_user_payload()
+        self.github_issues = payloads.github_issue_payloads(size, seed)
+        self.dependabot_alerts = payloads.dependabot_alert_payloads(max(1, size // 10), seed)
+        self.calendar_events = payloads.calendar_event_payloads(size, seed, self.today)["items"]
+        self.schedules = payloads.harmonogram_schedule_payload(size, seed)
+
+        self.labels = [{"id": "l-1", "name": "wrike-todoist"}]
+        self.version = 1
+        self.tasks: Dict[str, Dict] = {}
+        self.processed_commands: Dict[str, object] = {}
+        sources = {
+            "p-github": [issue["html_url"] for issue in self.github_issues],
+            "p-calendar": [event["htmlLink"] for event in self.calendar_events],
+            "p-harmonogram": [],
+        }
+        for project_id, descriptions in sources.items():
+            for task in payloads.todoist_task_payloads(size, seed, descriptions):
+                task = {**task, "id": f"{project_id}-{task['id']}", "project_id": project_id, "is_deleted": False}
+                if task["checked"]:
+                    task["completed_at"] = f"{self.today.isoformat()}T08:00:00Z"
+                self._store(task)
+
+    def _store(self, task: Dict):
+        self.version += 1
+        self.tasks[task["id"]] = {**task, "_version": self.version}
+
+    @staticmethod
+    def public(task: Dict) -> Dict:
+        return {key: value for key, value in task.items() if not key.startswith("_")}
+
+    def _due(self, due: Optional[Dict]) -> Optional[Dict]:
+        if not due:
+            return None
+        return {"date": self.today.isoformat(), "string": due.get("string"), "is_recurring": False, "timezone": None}
+
+    def apply_command(self, command: Dict, temp_id_mapping: Dict[str, str]) -> object:
+        if command["uuid"] in self.processed_commands:
+            return self.processed_commands[command["uuid"]]
+        args = command.get("args", {})
+        task = self.tasks.get(str(args.get("id")))
+        if command["type"] != "item_add" and (task is None or task["is_deleted"]):
+            status = {"error_code": 22, "error": "Item not found"}
+        elif command["type"] == "item_add":
+            task_id = f"t-{self.version + 1}"
+            temp_id_mapping[command["temp_id"]] = task_id
+            self._store(
+                {
+                    "id": task_id,
+                    "content": args["content"],
+                    "description": args.get("description", ""),
+                    "project_id": args["project_id"],
+                    "labels": args.get("labels", []),
+                    "priority": args.get("priority", 1),
+                    "due": self._due(args.get("due")),
+                    "checked": False,
+                    "is_deleted": False,
+                    "updated_at": _now(),
+                }
+            )
+            status = "ok"
+        else:
+            changes = {
+                "item_update": {
+                    **{key: value for key, value in args.items() if key not in ("id", "due")},
+                    **({"due": self._due(args["due"])} if "due" in args else {}),
+                },
+                "item_close": {"checked": True, "completed_at": _now()},
+                "item_uncomplete": {"checked": False},
+                "item_delete": {"is_deleted": True},
+            }.get(command["type"])
+            if changes is None:
+                status = {"error_code": 42, "error": f"Unknown command {command['type']}"}
+            else:
+                self._store({**task, **changes, "updated_at": _now()})
+                status = "ok"
+        self.processed_commands[command["uuid"]] = status
+        return status
+
+
+class FakeApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], options: FakeApiOptions):
+        super().__init__(address, FakeApiHandler)
+        self.options = options
+        self.dataset = FakeDataset(options)
+        self.random = random.Random(options.seed)
+        self.stats_lock = threading.Lock()
+        self.request_counts: collections.Counter = collections.Counter()
+        self.status_counts: collections.Counter = collections.Counter()
+        self.rate_limit_windows: Dict[str, Tuple[float, int]] = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start_in_thread(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="fake-api", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> Dict:
+        with self.stats_lock:
+            return {
+                "requests": dict(sorted(self.request_counts.items())),
+                "statuses": dict(sorted(self.status_counts.items())),
+                "total": sum(self.request_counts.values()),
+            }
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.request_counts.clear()
+            self.status_counts.clear()
+
+    def count(self, endpoint: str, status: int):
+        with self.stats_lock:
+            self.request_counts[endpoint] += 1
+            self.status_counts[f"{endpoint} {status}"] += 1
+
+    def should_fail(self) -> bool:
+        with self.stats_lock:
+            return self.random.random() < self.options.error_rate
+
+    def rate_limit_headers(self, upstream: str) -> Tuple[bool, Dict[str, str]]:
+        """Count a request against the fixed window of an upstream, returns whether it is allowed."""
+        if not self.options.rate_limit:
+            return True, {}
+        with self.stats_lock:
+            now = time.time()
+            window_start, used = self.rate_limit_windows.get(upstream, (now, 0))
+            if now - window_start >= self.options.rate_limit_window:
+                window_start, used = now, 0
+            allowed = used < self.options.rate_limit
+            used += allowed
+            self.rate_limit_windows[upstream] = (window_start, used)
+        reset_at = window_start + self.options.rate_limit_window
+        headers = {
+            "X-RateLimit-Limit": str(self.options.rate_limit),
+            "X-RateLimit-Remaining": str(self.options.rate_limit - used),
+            "X-RateLimit-Reset": str(int(reset_at) + 1),
+        }
+        if not allowed:
+            headers["Retry-After"] = str(max(1, int(reset_at - now) + 1))
+        return allowed, headers
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    query: Dict[str, str]
+    form: Dict[str, str]
+    json: Optional[Dict]
+    headers: Dict[str, str]
+    match: re.Match
+
+
+def _page(items: List, page: int, per_page: int) -> List:
+    return items[(page - 1) * per_page : page * per_page]
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the clients' connection pooling is exercised
+    server: FakeApiServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method: str):
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        content_type = self.headers.get("Content-Type", "")
+        form = {key: values[-1] for key, values in parse_qs(raw_body.decode("utf-8")).items()} if (
+            "x-www-form-urlencoded" in content_type
+        ) else {}
+        body_json = json.loads(raw_body) if raw_body and "json" in content_type else None
+
+        if parts.path == "/_stats":
+            return self.respond(FakeResponse(200, self.server.stats()))
+
+        for route_method, pattern, upstream, endpoint, handler in ROUTES:
+            match = re.fullmatch(pattern, parts.path)
+            if route_method != method or match is None:
+                continue
+            query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+            request = Request(method, parts.path, query, form, body_json, dict(self.headers), match)
+            if self.server.options.latency:
+                time.sleep(self.server.options.latency)
+            allowed, rate_limit_headers = self.server.rate_limit_headers(upstream)
+            if not allowed:
+                response = FakeResponse(429, {"error": "Rate limit exceeded"})
+            elif self.server.should_fail():
+                response = FakeResponse(503, {"error": "Injected failure"})
+            else:
+                with self.server.dataset.lock:
+                    response = handler(self.server.dataset, request)
+            response = response._replace(headers={**response.headers, **rate_limit_headers})
+            self.server.count(f"{upstream} {method} {endpoint}", response.status)
+            return self.respond(response)
+
+        self.server.count(f"unknown {method} {parts.path}", 404)
+        self.respond(FakeResponse(404, {"error": f"No fake for {method} {parts.path}"}))
+
+    def respond(self, response: FakeResponse):
+        body = b"" if response.body is None else json.dumps(response.body).encode("utf-8")
+        self.send_response(response.status)
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+        if response.body is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Todoist
+
+
+def _todoist_list(results: List, request: Request, page_size: int = TODOIST_PAGE_SIZE, key: str = "results"):
+    offset = int(request.query.get("cursor") or 0)
+    limit = int(request.query.get("limit") or page_size)
+    next_offset = offset + limit
+    return FakeResponse(
+        200, {key: results[offset:next_offset], "next_cursor": str(next_offset) if next_offset < len(results) else None}
+    )
+
+
+def todoist_projects(dataset: FakeDataset, request: Request) -> FakeResponse:
+    return _todoist_list([{"id": project_id, "name": name} for name, project_id in PROJECTS.items()], request)
+
+
+def todoist_labels(dataset: FakeDataset, request: Request) -> FakeResponse:
+    return _todoist_list(dataset.labels, request)
+
+
+def todoist_create_label(dataset: FakeDataset, request: Request) -> FakeResponse:
+    label = {"id": f"l-{len(dataset.labels) + 1}", "name": request.json["name"]}
+    dataset.labels.append(label)
+    return FakeResponse(200, label)
+
+
+def _project_tasks(dataset: FakeDataset, project_id: Optional[str], checked: bool) -> List[Dict]:
+    return [
+        dataset.public(task)
+        for task in dataset.tasks.values()
+        if not task["is_deleted"] and task["checked"] == checked and project_id in (None, task["project_id"])
+    ]
+
+
+def todoist_tasks(dataset: FakeDataset, request: Request) -> FakeResponse:
+    return _todoist_list(_project_tasks(dataset, request.query.get("project_id"), checked=False), request)
+
+
+def todoist_completed_tasks(dataset: FakeDataset, request: Request) -> FakeResponse:
+    return _todoist_list(_project_tasks(dataset, request.query.get("project_id"), checked=True), request, key="items")
+
+
+def todoist_task(dataset: FakeDataset, request: Request) -> FakeResponse:
+    task = dataset.tasks.get(request.match.group(1))
+    if task is None or task["is_deleted"]:
+        return FakeResponse(404, {"error": "Task not found"})
+    return FakeResponse(200, dataset.public(task))
+
+
+def todoist_sync(dataset: FakeDataset, request: Request) -> FakeResponse:
+    if "commands" in request.form:
+        temp_id_mapping = {}
+        sync_status = {
+            command["uuid"]: dataset.apply_command(command, temp_id_mapping)
+            for command in json.loads(request.form["commands"])
+        }
+        return FakeResponse(
+            200, {"sync_status": sync_status, "temp_id_mapping": temp_id_mapping, "sync_token": str(dataset.version)}
+        )
+
+    sync_token = request.form.get("sync_token", "*")
+    if sync_token == "*":
+        items = [dataset.public(task) for task in dataset.tasks.values() if not task["is_deleted"]]
+    elif sync_token.isdigit() and int(sync_token) <= dataset.version:
+        items = [dataset.public(task) for task in dataset.tasks.values() if task["_version"] > int(sync_token)]
+    else:
+        return FakeResponse(400, {"error": "Invalid sync token"})
+    body = {"items": items, "sync_token": str(dataset.version), "full_sync": sync_token == "*"}
+    if "projects" in json.loads(request.form.get("resource_types", "[]")):
+        # Projects never change here, so only a full sync lists them
+        projects = [{"id": project_id, "name": name} for name, project_id in PROJECTS.items()]
+        body["projects"] = projects if sync_token == "*" else []
+    return FakeResponse(200, body)
+
+
+# GitHub
+
+
+def _github_json(request: Request, body: object, links: Optional[Dict[str, str]] = None) -> FakeResponse:
+    etag = '"' + hashlib.sha1(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest() + '"'
+    headers = {"ETag": etag}
+    if links:
+        headers["Link"] = ", ".join(f'<{url}>; rel="{rel}"' for rel, url in links.items())
+    if request.headers.get("If-None-Match") == etag:
+        return FakeResponse(304, None, headers)
+    return FakeResponse(200, body, headers)
+
+
+def _github_page(request: Request, items: List, wrap: Optional[Callable[[List], object]] = None) -> FakeResponse:
+    per_page = int(request.query.get("per_page") or 30)
+    page = int(request.query.get("page") or 1)
+    last_page = max(1, -(-len(items) // per_page))
+    links = {}
+    if page < last_page:
+        base = f"{UPSTREAM_HOSTS['github']}{request.path}"
+        links["next"] = f"{base}?{urlencode({**request.query, 'page': page + 1})}"
+        links["last"] = f"{base}?{urlencode({**request.query, 'page': last_page})}"
+    page_items = _page(items, page, per_page)
+    return _github_json(request, wrap(page_items) if wrap else page_items, links)
+
+
+def _github_search(dataset: FakeDataset, query: str) -> List[Dict]:
+    login = dataset.github_user["login"]
+    pull_requests = [
+        issue for issue in dataset.github_issues if "pull_request" in issue and not issue["pull_request"]["draft"]
+    ]
+    if "review-requested:@me" in query:
+        return [issue for issue in pull_requests if issue["user"]["login"] != login]
+    if "author:@me" in query:
+        return [issue for issue in pull_requests if issue["user"]["login"] == login]
+    return [issue for issue in dataset.github_issues if "pull_request" not in issue]
+
+
+def github_user(dataset: FakeDataset, request: Request) -> FakeResponse:
+    return _github_json(request, dataset.github_user)
+
+
+def github_issues(dataset: FakeDataset, request: Request) -> FakeResponse:
+    return _github_page(request, _github_search(dataset, "assignee:@me"))
+
+
+def github_search_issues(dataset: FakeDataset, request: Request) -> FakeResponse:
+    items = _github_search(dataset, request.query.get("q", ""))
+    return _github_page(
+        request, items, lambda page_items: {"total_count": len(items), "incomplete_results": False, "items": page_items}
+    )
+
+
+def github_dependabot_alerts(dataset: FakeDataset, request: Request) -> FakeResponse:
+    return _github_page(request, dataset.dependabot_alerts)
+
+
+def _graphql_node(issue: Dict) -> Dict:
+    repository = "/".join(issue["repository_url"].split("/")[-2:])
+    node = {
+        "__typename": "PullRequest" if "pull_request" in issue else "Issue",
+        "databaseId": issue["id"],
+        "number": issue["number"],
+        "title": issue["title"],
+        "url": issue["html_url"],
+        "state": issue["state"].upper(),
+        "repository": {"nameWithOwner": repository},
+        "author": issue["user"],
+        "labels": {"nodes": issue["labels"]},
+    }
+    if "pull_request" in issue:
+        node["isDraft"] = issue["pull_request"]["draft"]
+    return node
+
+
+def github_graphql(dataset: FakeDataset, request: Request) -> FakeResponse:
+    variables = request.json.get("variables", {})
+    data = {}
+    for alias in ("assigned", "reviewRequests", "created"):
+        if not variables.get(f"with{alias[0].upper()}{alias[1:]}"):
+            continue
+        items = _github_search(dataset, variables.get(f"{alias}Query", ""))
+        offset = int(variables.get(f"{alias}Cursor") or 0)
+        end = offset + GRAPHQL_PAGE_SIZE
+        data[alias] = {
+            "pageInfo": {"hasNextPage": end < len(items), "endCursor": str(end)},
+            "nodes": [_graphql_node(issue) for issue in items[offset:end]],
+        }
+    return FakeResponse(200, {"data": data})
+
+
+# Google
+
+
+def google_token(dataset: FakeDataset, request: Request) -> FakeResponse:
+    return FakeResponse(200, {"access_token": "fake-access-token", "expires_in": 3600, "token_type": "Bearer"})
+
+
+def google_calendar_events(dataset: FakeDataset, request: Request) -> FakeResponse:
+    sync_token = f"sync-{len(dataset.calendar_events)}"
+    if "syncToken" in request.query:
+        if request.query["syncToken"] != sync_token:
+            return FakeResponse(410, {"error": {"code": 410, "message": "Sync token is no longer valid"}})
+        return FakeResponse(200, {"kind": "calendar#events", "items": [], "nextSyncToken": sync_token})
+
+    offset = int(request.query.get("pageToken") or 0)
+    end = offset + int(request.query.get("maxResults") or CALENDAR_PAGE_SIZE)
+    body = {"kind": "calendar#events", "items": dataset.calendar_events[offset:end]}
+    if end < len(dataset.calendar_events):
+        body["nextPageToken"] = str(end)
+    else:
+        body["nextSyncToken"] = sync_token
+    return FakeResponse(200, body)
+
+
+# ecoharmonogram
+
+
+def harmonogram_streets_for_town(dataset: FakeDataset, request: Request) -> FakeResponse:
+    return FakeResponse(200, [{"name": "ul. Potockiego", "perId": "42"}, {"name": "ul. Kopisto", "perId": "43"}])
+
+
+def harmonogram_streets(dataset: FakeDataset, request: Request) -> FakeResponse:
+    return FakeResponse(200, {"streets": [{"numbers": "188/E/1", "id": "4242"}, {"numbers": "1", "id": "4243"}]})
+
+
+def harmonogram_schedules(dataset: FakeDataset, request: Request) -> FakeResponse:
+    return FakeResponse(200, dataset.schedules)
+
+
+# (method, path pattern, upstream, endpoint name used in the stats, handler)
+ROUTES: List[Tuple[str, str, str, str, Callable[[FakeDataset, Request], FakeResponse]]] = [
+    ("GET", r"/api/v1/projects", "todoist", "/projects", todoist_projects),
+    ("GET", r"/api/v1/labels", "todoist", "/labels", todoist_labels),
+    ("POST", r"/api/v1/labels", "todoist", "/labels", todoist_create_label),
+    ("GET", r"/api/v1/tasks", "todoist", "/tasks", todoist_tasks),
+    ("GET", r"/api/v1/tasks/completed", "todoist", "/tasks/completed", todoist_completed_tasks),
+    ("GET", r"/api/v1/tasks/([^/]+)", "todoist", "/tasks/{id}", todoist_task),
+    ("POST", r"/api/v1/sync", "todoist", "/sync", todoist_sync),
+    ("GET", r"/user", "github", "/user", github_user),
+    ("GET", r"/issues", "github", "/issues", github_issues),
+    ("GET", r"/search/issues", "github", "/search/issues", github_search_issues),
+    (
+        "GET",
+        r"/repos/[^/]+/[^/]+/dependabot/alerts",
+        "github",
+        "/repos/{repo}/dependabot/alerts",
+        github_dependabot_alerts,
+    ),
+    ("POST", r"/graphql", "github", "/graphql", github_graphql),
+    ("POST", r"/token", "google", "/token", google_token),
+    (
+        "GET",
+        r"/calendar/v3/calendars/[^/]+/events",
+        "google",
+        "/calendar/v3/calendars/{id}/events",
+        google_calendar_events,
+    ),
+    ("POST", r"/v1/plugin/v1/streetsForTown", "harmonogram", "/streetsForTown", harmonogram_streets_for_town),
+    ("POST", r"/v1/plugin/v1/streets", "harmonogram", "/streets", harmonogram_streets),
+    ("POST", r"/v1/plugin/v1/schedules", "harmonogram", "/schedules", harmonogram_schedules),
+]
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8765, show_default=True)
+@click.option("--dataset-size", default=1000, show_default=True, help="Items per upstream")
+@click.option("--seed", default=0, show_default=True)
+@click.option("--latency-ms", default=0.0, show_default=True, help="Added to every response")
+@click.option("--error-rate", default=0.0, show_default=True, type=click.FloatRange(0, 1), help="Share of 503s")
+@click.option("--rate-limit", default=0, show_default=True, help="Requests per upstream and window, 0 = unlimited")
+@click.option("--rate-limit-window", default=60.0, show_default=True, help="Seconds")
+def main(host, port, dataset_size, seed, latency_ms, error_rate, rate_limit, rate_limit_window):
+    options = FakeApiOptions(
+        dataset_size=dataset_size,
+        seed=seed,
+        latency=latency_ms / 1000,
+        error_rate=error_rate,
+        rate_limit=rate_limit,
+        rate_limit_window=rate_limit_window,
+    )
+    server = FakeApiServer((host, port), options)
+    click.echo(f"Serving fake APIs on {server.url}, run the CLI with WRIKE_TODOIST_API_ENDPOINT={server.url}")
+    click.echo("Use a separate WRIKE_TODOIST_CACHE_DIR, the caches would otherwise mix fake and real data.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        click.echo(json.dumps(server.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
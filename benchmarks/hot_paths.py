@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Micro-benchmarks of the CPU-bound hot paths: parsing, building expected tasks, diffing and serialization.
+
+Every stage runs on seeded synthetic payloads (see payloads.py) at each size. The best of `--repeat`
+timings and the peak memory of a separate traced run are reported per stage and size. The results
+are compared against a stored baseline, and the run fails when a stage got slower or hungrier than
+the tolerance allows. Baselines depend on the machine, so record them where the comparison runs.
+
+    python benchmarks/hot_paths.py [--sizes 100,1000,10000,100000] [--save-baseline] [--stage reconcile]
+"""
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The models read the default task priority from the config, no request leaves the process
+for variable in (
+    "GCP_CLIENT_ID",
+    "GCP_CLIENT_SECRET",
+    "GOOGLE_CALENDAR_REFRESH_TOKEN",
+    "GOOGLE_CALENDAR_ID",
+    "TODOIST_ACCESS_TOKEN",
+    "TODOIST_PROJECT_NAME",
+    "TODOIST_LABEL",
+    "GITHUB_CLASSIC_TOKEN",
+):
+    os.environ.setdefault(variable, "benchmark")
+
+import payloads  # noqa: E402
+from wrike_todoist.github import models as github_models  # noqa: E402
+from wrike_todoist.google_calendar import models as google_calendar_models  # noqa: E402
+from wrike_todoist.harmonogram import models as harmonogram_models  # noqa: E402
+from wrike_todoist.todoist import api as todoist_api, models as todoist_models  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+PROJECT_ID = "6Jf8VQXxpwv56VQ7"
+
+
+class Stage(NamedTuple):
+    name: str
+    # Builds the input outside of the measurement
+    setup: Callable[[int, int], Any]
+    run: Callable[[Any], Any]
+
+
+def _github_items(size: int, seed: int) -> github_models.GitHubIssueCollection:
+    current_user = github_models.GitHubUser.from_response(payloads.github_user_payload())
+    return github_models.GitHubIssueCollection.from_response(payloads.github_issue_payloads(size, seed), current_user)
+
+
+def _github_comparison_input(size: int, seed: int):
+    expected = todoist_models.TodoistTaskCollection.from_github_items(_github_items(size, seed), PROJECT_ID)
+    descriptions = [task.description for task in expected]
+    return expected, payloads.todoist_task_payloads(size, seed, descriptions)
+
+
+def _calendar_comparison_input(size: int, seed: int):
+    events = google_calendar_models.CalendarEventCollection.from_response(payloads.calendar_event_payloads(size, seed))
+    expected = todoist_models.TodoistTaskCollection.from_calendar_events(events, PROJECT_ID)
+    descriptions = [task.description for task in expected]
+    return expected, payloads.todoist_task_payloads(size, seed, descriptions)
+
+
+def _harmonogram_comparison_input(size: int, seed: int):
+    collection_days = harmonogram_models.CollectionDayCollection.from_response(
+        payloads.harmonogram_schedule_payload(size, seed)
+    )
+    expected = todoist_models.TodoistTaskCollection.from_harmonogram(collection_days, PROJECT_ID)
+    descriptions = [task.description for task in expected]
+    return expected, payloads.todoist_task_payloads(size, seed, descriptions)
+
+
+def _plan_reconciliations(expected, actual_payloads, policy):
+    # Like the pipelines, the actual tasks are parsed while they are streamed into the reconciliation
+    actual = (todoist_models.TodoistTask.from_response(payload) for payload in actual_payloads)
+    reconciliations = todoist_models.TodoistTaskCollection.reconcile(expected, actual, policy)
+    return todoist_api.todoist_plan_reconciliations(None, reconciliations, policy.remove_closed)
+
+
+def _todoist_tasks(size: int, seed: int) -> todoist_models.TodoistTaskCollection:
+    descriptions = [f"https://github.com/acme/api/issues/{number}" for number in range(size // 2)]
+    return todoist_models.TodoistTaskCollection.from_response(payloads.todoist_task_payloads(size, seed, descriptions))
+
+
+STAGES: List[Stage] = [
+    Stage(
+        "parse.todoist_tasks",
+        lambda size, seed: payloads.todoist_task_payloads(size, seed),
+        todoist_models.TodoistTaskCollection.from_response,
+    ),
+    Stage(
+        "parse.todoist_due",
+        lambda size, seed: [payload["due"] for payload in payloads.todoist_task_payloads(size, seed)],
+        lambda dues: [todoist_models.Due.from_response(due) for due in dues],
+    ),
+    Stage(
+        "parse.calendar_events",
+        lambda size, seed: payloads.calendar_event_payloads(size, seed),
+        google_calendar_models.CalendarEventCollection.from_response,
+    ),
+    Stage(
+        "parse.github_issues",
+        lambda size, seed: (
+            payloads.github_issue_payloads(size, seed),
+            github_models.GitHubUser.from_response(payloads.github_user_payload()),
+        ),
+        lambda args: github_models.GitHubIssueCollection.from_response(*args),
+    ),
+    Stage(
+        "parse.harmonogram_schedules",
+        lambda size, seed: payloads.harmonogram_schedule_payload(size, seed),
+        harmonogram_models.CollectionDayCollection.from_response,
+    ),
+    Stage(
+        "expected.github",
+        _github_items,
+        lambda items: todoist_models.TodoistTaskCollection.from_github_items(items, PROJECT_ID),
+    ),
+    Stage(
+        "reconcile.github",
+        _github_comparison_input,
+        lambda args: _plan_reconciliations(*args, todoist_models.GITHUB_POLICY),
+    ),
+    Stage(
+        "reconcile.calendar",
+        _calendar_comparison_input,
+        lambda args: _plan_reconciliations(*args, todoist_models.CALENDAR_POLICY),
+    ),
+    Stage(
+        "reconcile.harmonogram",
+        _harmonogram_comparison_input,
+        lambda args: _plan_reconciliations(*args, todoist_models.HARMONOGRAM_POLICY),
+    ),
+    Stage("collection.distinct", _todoist_tasks, lambda tasks: tasks.distinct()),
+    Stage("collection.filter_fields", _todoist_tasks, lambda tasks: tasks.filter(is_completed=True)),
+    Stage("collection.filter_callable", _todoist_tasks, lambda tasks: tasks.filter(lambda task: task.due is None)),
+    Stage("serialize.todoist_tasks", _todoist_tasks, lambda tasks: [task.serialize() for task in tasks]),
+    Stage(
+        "serialize.sync_commands",
+        _todoist_tasks,
+        lambda tasks: [todoist_models.TodoistSyncCommand.item_add(task).serialize() for task in tasks],
+    ),
+]
+
+
+class Measurement(NamedTuple):
+    seconds: float
+    peak_bytes: int
+
+
+def measure(stage: Stage, size: int, seed: int, repeat: int) -> Measurement:
+    timings = []
+    for _ in range(repeat):
+        stage_input = stage.setup(size, seed)
+        gc.collect()
+        started = time.perf_counter()
+        stage.run(stage_input)
+        timings.append(time.perf_counter() - started)
+
+    # Traced separately, tracemalloc slows the stage down considerably
+    stage_input = stage.setup(size, seed)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        stage.run(stage_input)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return Measurement(seconds=min(timings), peak_bytes=peak_bytes)
+
+
+def compare_to_baseline(
+    results: Dict[str, Measurement], baseline: Dict[str, Dict], tolerance: float, min_delta: float
+) -> List[str]:
+    regressions = []
+    for key, measurement in results.items():
+        expected = baseline[key]
+        # Sub-millisecond stages are mostly timer noise, so a slowdown also has to exceed min_delta seconds
+        if measurement.seconds > max(expected["seconds"] * (1 + tolerance), expected["seconds"] + min_delta):
+            regressions.append(
+                f"{key}: {measurement.seconds * 1000:.2f} ms, baseline {expected['seconds'] * 1000:.2f} ms"
+            )
+        if measurement.peak_bytes > expected["peak_bytes"] * (1 + tolerance):
+            regressions.append(
+                f"{key}: peak {measurement.peak_bytes / 2**20:.2f} MiB, "
+                f"baseline {expected['peak_bytes'] / 2**20:.2f} MiB"
+            )
+    return regressions
+
+
+@click.command()
+@click.option("--sizes", default="100,1000,10000,100000", show_default=True, help="Comma separated item counts")
+@click.option("--seed", default=0, show_default=True)
+@click.option("--repeat", default=3, show_default=True, type=click.IntRange(min=1), help="Best of this many runs")
+@click.option("--stage", "stage_prefixes", multiple=True, help="Only run stages starting with this prefix")
+@click.option("--baseline", "baseline_path", default=DEFAULT_BASELINE, show_default=True, type=click.Path())
+@click.option("--save-baseline", is_flag=True, help="Store the results as the new baseline instead of comparing")
+@click.option("--tolerance", default=0.25, show_default=True, help="Allowed slowdown or growth over the baseline")
+@click.option("--min-delta-ms", default=5.0, show_default=True, help="Slowdowns below this are never regressions")
+def main(sizes, seed, repeat, stage_prefixes, baseline_path, save_baseline, tolerance, min_delta_ms):
+    stages = [stage for stage in STAGES if not stage_prefixes or stage.name.startswith(tuple(stage_prefixes))]
+    results = {}
+    for stage in stages:
+        for size in [int(size) for size in sizes.split(",")]:
+            measurement = measure(stage, size, seed, repeat)
+            results[f"{stage.name}@{size}"] = measurement
+            click.echo(
+                f"{stage.name:<30} {size:>7}  {measurement.seconds * 1000:10.2f} ms  "
+                f"{measurement.peak_bytes / 2**20:8.2f} MiB peak"
+            )
+
+    try:
+        with open(baseline_path, encoding="utf-8") as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        baseline = {}
+
+    if save_baseline:
+        baseline.update({key: measurement._asdict() for key, measurement in results.items()})
+        with open(baseline_path, "w", encoding="utf-8") as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+        click.echo(f"Saved {len(results)} results to {baseline_path}")
+        return
+
+    # A stage without a baseline would pass unchecked, so that is an error rather than a silent pass
+    missing = [key for key in results if key not in baseline]
+    if missing:
+        raise click.ClickException(
+            f"No baseline in {baseline_path} for {', '.join(missing)}, run with --save-baseline to record one."
+        )
+    regressions = compare_to_baseline(results, baseline, tolerance, min_delta_ms / 1000)
+    if regressions:
+        raise click.ClickException("Regressions over the baseline:\n" + "\n".join(regressions))
+    click.echo(f"No regressions over the baseline (tolerance {tolerance:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Import-time budget for the CLI entry point.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter, sums the self time of every
+imported module and fails when the total exceeds the budget, or when a module that should only be
+imported by an enabled pipeline shows up.
+
+    python benchmarks/import_time.py [--budget-ms 150] [--module wrike_todoist.console]
+"""
+import re
+import subprocess
+import sys
+
+import click
+
+# Heavy dependencies that only a pipeline should pull in
+DEFERRED_MODULES = ("googleapiclient", "google.oauth2", "pendulum", "yaml", "requests")
+
+RE_IMPORTTIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure_import_time(module: str) -> dict:
+    """Self time in microseconds per imported module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    self_times = {}
+    for line in result.stderr.splitlines():
+        match = RE_IMPORTTIME.match(line)
+        if match:
+            self_times[match.group(4)] = int(match.group(1))
+    return self_times
+
+
+@click.command()
+@click.option("--module", default="wrike_todoist.console", show_default=True)
+@click.option("--budget-ms", default=150.0, show_default=True, help="Total import time allowed")
+@click.option("--top", default=10, show_default=True, help="How many of the slowest modules to print")
+def main(module, budget_ms, top):
+    self_times = measure_import_time(module)
+    total_ms = sum(self_times.values()) / 1000
+
+    for name, self_time in sorted(self_times.items(), key=lambda item: item[1], reverse=True)[:top]:
+        click.echo(f"{self_time / 1000:8.2f} ms  {name}")
+    click.echo(f"{total_ms:8.2f} ms  total for {module} (budget {budget_ms:.0f} ms)")
+
+    leaked = sorted(
+        name
+        for name in self_times
+        if any(name == deferred or name.startswith(f"{deferred}.") for deferred in DEFERRED_MODULES)
+    )
+    if leaked:
+        raise click.ClickException(f"Deferred modules imported eagerly: {', '.join(leaked)}")
+    if total_ms > budget_ms:
+        raise click.ClickException(f"Import time {total_ms:.2f} ms exceeds the budget of {budget_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+End-to-end load test of the CLI against the local fake APIs (see fake_api.py).
+
+Starts the fake server in-process and points `wrike_todoist.console.main` at it through
+WRIKE_TODOIST_API_ENDPOINT, with a throwaway cache directory. It then runs the selected pipelines
+`--runs` times and reports wall time, request throughput and the requests per endpoint of every run.
+The first run starts with cold caches, later runs show the effect of the incremental syncs and the
+state store.
+
+    python benchmarks/load_test.py [--dataset-size 1000] [--latency-ms 50] [--runs 2] [-j 3]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_api  # noqa: E402
+
+PIPELINE_FLAGS = {
+    "google_calendar": "--google-calendar",
+    "harmonogram": "--harmonogram",
+    "github": "--github",
+}
+
+
+@click.command()
+@click.option("--dataset-size", default=1000, show_default=True, help="Items per upstream")
+@click.option("--seed", default=0, show_default=True)
+@click.option("--latency-ms", default=20.0, show_default=True)
+@click.option("--error-rate", default=0.0, show_default=True, type=click.FloatRange(0, 1))
+@click.option("--rate-limit", default=0, show_default=True, help="Requests per upstream and window, 0 = unlimited")
+@click.option("--rate-limit-window", default=60.0, show_default=True)
+@click.option(
+    "--pipeline",
+    "pipelines",
+    multiple=True,
+    type=click.Choice(list(PIPELINE_FLAGS)),
+    help="Pipelines to run, all by default",
+)
+@click.option("--jobs", "-j", default=1, show_default=True, type=click.IntRange(min=1))
+@click.option("--runs", default=2, show_default=True, type=click.IntRange(min=1))
+@click.option("--stats-json", type=click.Path(), help="Also write the per-run stats to this file")
+def main(
+    dataset_size, seed, latency_ms, error_rate, rate_limit, rate_limit_window, pipelines, jobs, runs, stats_json
+):
+    options = fake_api.FakeApiOptions(
+        dataset_size=dataset_size,
+        seed=seed,
+        latency=latency_ms / 1000,
+        error_rate=error_rate,
+        rate_limit=rate_limit,
+        rate_limit_window=rate_limit_window,
+    )
+    server = fake_api.FakeApiServer(("127.0.0.1", 0), options)
+    server.start_in_thread()
+
+    cache_dir = tempfile.mkdtemp(prefix="wrike-todoist-load-")
+    os.environ["WRIKE_TODOIST_API_ENDPOINT"] = server.url
+    os.environ["WRIKE_TODOIST_CACHE_DIR"] = cache_dir
+    for variable in (
+        "GCP_CLIENT_ID",
+        "GCP_CLIENT_SECRET",
+        "GOOGLE_CALENDAR_REFRESH_TOKEN",
+        "GOOGLE_CALENDAR_ID",
+        "TODOIST_ACCESS_TOKEN",
+        "TODOIST_PROJECT_NAME",
+        "TODOIST_LABEL",
+        "GITHUB_CLASSIC_TOKEN",
+    ):
+        os.environ.setdefault(variable, "load-test")
+
+    from wrike_todoist import console  # after the environment is set, the config is read on first use
+
+    selected = pipelines or tuple(PIPELINE_FLAGS)
+    args = [flag if name in selected else f"--no-{flag[2:]}" for name, flag in PIPELINE_FLAGS.items()]
+    args += ["--jobs", str(jobs)]
+
+    results = []
+    try:
+        for run in range(1, runs + 1):
+            server.reset_stats()
+            started = time.perf_counter()
+            try:
+                console.main(args, standalone_mode=False)
+                failed = False
+            except click.ClickException as e:
+                click.echo(e.format_message())
+                failed = True
+            duration = time.perf_counter() - started
+            stats = server.stats()
+            results.append({"run": run, "seconds": duration, **stats})
+
+            click.echo(
+                f"Run {run}: {duration:.2f}s, {stats['total']} requests, "
+                f"{stats['total'] / duration:.1f} requests/s{' (failed)' if failed else ''}"
+            )
+            for endpoint, count in stats["requests"].items():
+                click.echo(f"  {count:>6}  {endpoint}")
+    finally:
+        server.shutdown()
+        server.server_close()
+        click.echo(f"Caches of the load test are in {cache_dir}")
+
+    if stats_json:
+        with open(stats_json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
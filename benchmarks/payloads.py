@@ -0,0 +1,169 @@
+"""
+Seeded generators of synthetic API payloads, shaped like the responses the adapters parse.
+
+The same seed and size always give the same payloads, so benchmark runs are comparable.
+"""
+import datetime
+import random
+from typing import Dict, List, Optional, Sequence
+
+REPOSITORIES = ("acme/api", "acme/web", "acme/infra", "acme/mobile", "oss/toolkit")
+LABELS = ("bug", "enhancement", "dependencies", "security", "good first issue", "P2")
+WASTE_TYPES = ("zmieszane", "papier", "plastik", "szkło", "bio", "gabaryty")
+WORDS = (
+    "fix", "update", "refactor", "add", "remove", "flaky", "test", "cache", "sync", "timeout",
+    "calendar", "review", "release", "dependency", "parser", "config", "retry", "docs", "p1", "p3",
+)  # fmt: skip
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def _timestamp(rng: random.Random) -> str:
+    month, day, hour = rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23)
+    return f"2026-{month:02d}-{day:02d}T{hour:02d}:{rng.choice((0, 30)):02d}:00Z"
+
+
+def github_user_payload() -> Dict:
+    return {"id": 1, "login": "octocat", "name": "The Octocat", "html_url": "https://github.com/octocat"}
+
+
+def github_issue_payloads(size: int, seed: int = 0) -> List[Dict]:
+    """Items of the issues and search endpoints, a third of them pull requests."""
+    rng = random.Random(seed)
+    payloads = []
+    for number in range(1, size + 1):
+        repository = rng.choice(REPOSITORIES)
+        is_pull_request = number % 3 == 0
+        kind = "pull" if is_pull_request else "issues"
+        payload = {
+            "id": 10_000_000 + number,
+            "number": number,
+            "title": _sentence(rng, rng.randint(3, 9)),
+            "html_url": f"https://github.com/{repository}/{kind}/{number}",
+            "repository_url": f"https://api.github.com/repos/{repository}",
+            "state": "open",
+            "body": _sentence(rng, rng.randint(10, 60)),
+            "labels": [{"name": label} for label in rng.sample(LABELS, rng.randint(0, 3))],
+            "user": {"login": rng.choice(("octocat", "hubot", "dependabot[bot]"))},
+            "created_at": _timestamp(rng),
+            "updated_at": _timestamp(rng),
+        }
+        if is_pull_request:
+            payload["pull_request"] = {"draft": rng.random() < 0.2}
+        payloads.append(payload)
+    return payloads
+
+
+def dependabot_alert_payloads(size: int, seed: int = 0, repository: str = "acme/api") -> List[Dict]:
+    """Open alerts of a repository, half of them assigned to the user of github_user_payload."""
+    rng = random.Random(seed)
+    return [
+        {
+            "number": number,
+            "state": "open",
+            "html_url": f"https://github.com/{repository}/security/dependabot/{number}",
+            "assignees": [{"login": "octocat"}] if number % 2 else [],
+            "security_advisory": {
+                "summary": _sentence(rng, rng.randint(4, 8)),
+                "description": _sentence(rng, rng.randint(20, 80)),
+            },
+            "security_vulnerability": {"severity": rng.choice(("low", "medium", "high", "critical"))},
+        }
+        for number in range(1, size + 1)
+    ]
+
+
+def calendar_event_payloads(size: int, seed: int = 0, day: datetime.date = datetime.date(2026, 10, 17)) -> Dict:
+    """An events.list response for `day`, with whole-day and recurring events mixed in."""
+    rng = random.Random(seed)
+    items = []
+    for index in range(size):
+        if rng.random() < 0.1:
+            start, end = {"date": day.isoformat()}, {"date": (day + datetime.timedelta(days=1)).isoformat()}
+        else:
+            hour = rng.randint(7, 19)
+            start = {"dateTime": f"{day.isoformat()}T{hour:02d}:00:00+02:00", "timeZone": "Europe/Warsaw"}
+            end = {"dateTime": f"{day.isoformat()}T{hour:02d}:45:00+02:00", "timeZone": "Europe/Warsaw"}
+        event_id = f"evt{index:08d}"
+        item = {
+            "kind": "calendar#event",
+            "etag": f'"{rng.getrandbits(48)}"',
+            "id": event_id,
+            "status": "confirmed",
+            "htmlLink": f"https://www.google.com/calendar/event?eid={event_id}",
+            "created": _timestamp(rng),
+            "updated": _timestamp(rng),
+            "summary": _sentence(rng, rng.randint(2, 6)),
+            "creator": {"displayName": "Me", "email": "me@example.com", "self": True},
+            "organizer": {"displayName": "Team", "email": "team@example.com"},
+            "start": start,
+            "end": end,
+            "iCalUID": f"{event_id}@google.com",
+            "sequence": rng.randint(0, 3),
+            "reminders": {"useDefault": True},
+            "eventType": "default",
+        }
+        if rng.random() < 0.3:
+            item["recurringEventId"] = f"rec{index % 50:04d}"
+            item["originalStartTime"] = start
+        items.append(item)
+    return {"kind": "calendar#events", "items": items}
+
+
+def harmonogram_schedule_payload(size: int, seed: int = 0) -> Dict:
+    """A schedules response with `size` collection days, two per month row."""
+    rng = random.Random(seed)
+    descriptions = [{"id": str(index), "name": name} for index, name in enumerate(WASTE_TYPES)]
+    schedules = []
+    for row in range((size + 1) // 2):
+        description = descriptions[row % len(descriptions)]
+        month_offset = row // len(descriptions)
+        days = sorted(rng.sample(range(1, 29), 2))
+        schedules.append(
+            {
+                "year": str(2026 + month_offset // 12),
+                "month": str(month_offset % 12 + 1),
+                "days": ";".join(str(day) for day in days),
+                "scheduleDescriptionId": description["id"],
+            }
+        )
+    return {"scheduleDescription": descriptions, "schedules": schedules}
+
+
+def todoist_task_payloads(size: int, seed: int = 0, descriptions: Optional[Sequence[str]] = None) -> List[Dict]:
+    """
+    Active and completed tasks of the v1 API.
+
+    With `descriptions` the tasks point at those source items (and some at removed ones), so a
+    comparison against the expected tasks has work in every bucket.
+    """
+    rng = random.Random(seed)
+    payloads = []
+    for index in range(size):
+        if descriptions and rng.random() < 0.9:
+            description = descriptions[index % len(descriptions)]
+        else:
+            description = f"https://github.com/acme/removed/issues/{index}"
+        due = None
+        if rng.random() < 0.7:
+            date = f"2026-10-{rng.randint(1, 28):02d}"
+            due = {"date": date, "is_recurring": False, "string": date, "timezone": None}
+            if rng.random() < 0.5:
+                due["datetime"] = f"{date}T{rng.randint(7, 19):02d}:00:00"
+                due["timezone"] = "Europe/Warsaw"
+        payloads.append(
+            {
+                "id": f"6X{index:010d}",
+                "content": _sentence(rng, rng.randint(3, 9)),
+                "description": description,
+                "project_id": "6Jf8VQXxpwv56VQ7",
+                "labels": rng.sample(LABELS, rng.randint(0, 2)),
+                "priority": rng.randint(1, 4),
+                "due": due,
+                "checked": rng.random() < 0.1,
+                "updated_at": _timestamp(rng),
+            }
+        )
+    return payloads
@@ -1,14 +1,196 @@
+import asyncio
 import json
 import logging
-from typing import Union
+import threading
+import time
+import weakref
+from typing import Awaitable, Dict, NamedTuple, Optional, Tuple, TypeVar, Union
+from urllib.parse import urlsplit, urlunsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from wrike_todoist import config, metrics, rate_limit
 
 logger = logging.getLogger(__name__)
 
 
 JSONValue = Union[dict, list, str, int, float, bool, None]
 
+DEFAULT_TIMEOUT: Tuple[float, float] = (3.05, 30)  # (connect, read) seconds
+DEFAULT_POOL_SIZE = 10
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+HOST_CONCURRENCY = DEFAULT_POOL_SIZE  # never have more requests in flight than pooled connections
+
+
+class PooledSession(requests.Session):
+    """requests.Session that applies a default timeout and the upstream rate limit to every request."""
+
+    def __init__(self, timeout: Tuple[float, float] = DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        # The governor and the metric labels use the real upstream, so a fake server is treated like it
+        governor = rate_limit.get_governor(url)
+        upstream = urlsplit(url)
+        url = redirect_to_api_endpoint(url)
+        if governor is not None:
+            governor.acquire()
+
+        started = time.monotonic()
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.observe_request(upstream.netloc, upstream.path, method, "error", time.monotonic() - started, None)
+            raise
+        metrics.observe_request(
+            upstream.netloc,
+            upstream.path,
+            method,
+            response.status_code,
+            time.monotonic() - started,
+            len(response.content),
+            retries=_retry_count(response),
+        )
+
+        if governor is not None:
+            governor.update(response)
+            metrics.rate_limit_remaining.set(governor.remaining(), limit=governor.name)
+        return response
+
+
+def _retry_count(response: requests.Response) -> int:
+    retries = getattr(response.raw, "retries", None)
+    return len(retries.history) if retries is not None else 0
+
+
+def redirect_to_api_endpoint(url: str) -> str:
+    """Point `url` at the configured `api_endpoint`, keeping its path and query."""
+    if not config.config.api_endpoint:
+        return url
+    endpoint = urlsplit(config.config.api_endpoint)
+    parts = urlsplit(url)
+    return urlunsplit((endpoint.scheme, endpoint.netloc, endpoint.path + parts.path, parts.query, parts.fragment))
+
+
+class ConnectionStats(NamedTuple):
+    requests: int
+    new_connections: int
+
+    @property
+    def reused_connections(self) -> int:
+        return self.requests - self.new_connections
+
+
+_sessions: Dict[Tuple[str, bool], PooledSession] = {}  # keyed by host and whether POSTs are retried
+_sessions_lock = threading.Lock()
+
+
+def _upstream_host(url: str) -> str:
+    return urlsplit(url).netloc or url
+
+
+def get_session(url: str, headers: Optional[Dict[str, str]] = None, retry_posts: bool = False) -> PooledSession:
+    """
+    Return the pooled session for the host of `url`, creating it on first use.
+
+    Headers (e.g. auth) are attached once, when the session is created. Only idempotent methods are
+    retried, unless `retry_posts` is set; do that only for sessions whose POSTs carry an idempotency key.
+    """
+    host = _upstream_host(url)
+    with _sessions_lock:
+        session = _sessions.get((host, retry_posts))
+        if session is None:
+            allowed_methods = Retry.DEFAULT_ALLOWED_METHODS | {"POST"} if retry_posts else Retry.DEFAULT_ALLOWED_METHODS
+            retry = Retry(
+                total=RETRY_TOTAL,
+                backoff_factor=RETRY_BACKOFF_FACTOR,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=allowed_methods,
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=DEFAULT_POOL_SIZE,
+                max_retries=retry,
+            )
+            session = PooledSession()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(headers or {})
+            _sessions[(host, retry_posts)] = session
+            logger.debug(f"Created pooled session for {host}{' retrying POSTs' if retry_posts else ''}.")
+    return session
+
+
+def connection_stats() -> Dict[str, ConnectionStats]:
+    stats = {}
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    for (host, _), session in sessions.items():
+        num_requests, num_connections = stats.get(host, (0, 0))
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                num_requests += pool.num_requests
+                num_connections += pool.num_connections
+        stats[host] = ConnectionStats(requests=num_requests, new_connections=num_connections)
+    return stats
+
+
+def log_connection_stats():
+    for host, stats in connection_stats().items():
+        logger.info(
+            f"{host}: {stats.requests} requests, {stats.new_connections} new connections, "
+            f"{stats.reused_connections} reused."
+        )
+
+
+_host_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def host_semaphore(url: str) -> asyncio.Semaphore:
+    """Semaphore bounding concurrent requests to the host of `url` within the running event loop."""
+    loop_semaphores = _host_semaphores.setdefault(asyncio.get_running_loop(), {})
+    host = _upstream_host(url)
+    if host not in loop_semaphores:
+        loop_semaphores[host] = asyncio.Semaphore(HOST_CONCURRENCY)
+    return loop_semaphores[host]
+
+
+async def async_request(
+    session: requests.Session, method: str, url: str, **kwargs
+) -> requests.Response:
+    """
+    Run a request on the pooled session without blocking the event loop.
+
+    The blocking call runs in the default executor, so the session keeps its pooling, timeouts and retries.
+    `asyncio.to_thread` runs it in a copy of the current context, so logs from the worker thread (e.g. urllib3
+    retries) are still attributed to the running pipeline.
+    """
+    async with host_semaphore(url):
+        return await asyncio.to_thread(session.request, method, url, **kwargs)
+
+
+Result = TypeVar("Result")
+
+
+def run_sync(awaitable: Awaitable[Result]) -> Result:
+    """Entry point for the synchronous wrappers around the async API functions."""
+    async def _await() -> Result:
+        return await awaitable
+
+    return asyncio.run(_await())
+
 
 def response_to_json_value(
     response: requests.Response, encoding: str = "utf-8"
@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from wrike_todoist import config
+from wrike_todoist.api_utils import JSONValue
+
+logger = logging.getLogger(__name__)
+
+
+class PersistentCache:
+    """
+    Key/value cache shared within the process and persisted to a JSON file between runs.
+
+    Entries older than `ttl` seconds are treated as missing; `ttl=None` keeps them until invalidated.
+    """
+
+    def __init__(self, name: str, ttl: Optional[float] = None):
+        self.name = name
+        self.ttl = ttl
+        self.path = os.path.join(config.config.cache_dir, f"{name}.json")
+        self._lock = threading.RLock()
+        self._entries: Optional[Dict[str, Dict]] = None
+
+    def _load(self) -> Dict[str, Dict]:
+        if self._entries is None:
+            try:
+                with open(self.path, encoding="utf-8") as file:
+                    self._entries = json.load(file)
+            except (IOError, json.JSONDecodeError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(self._entries, file)
+        os.replace(temporary_path, self.path)
+
+    def get(self, key: str) -> Optional[JSONValue]:
+        with self._lock:
+            entry = self._load().get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.time() - entry["stored_at"] > self.ttl:
+            logger.info(f"Cache {self.name}[{key}] expired.")
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: JSONValue):
+        with self._lock:
+            self._load()[key] = {"stored_at": time.time(), "value": value}
+            self._save()
+
+    def invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            entries = self._load()
+            if key is None:
+                entries.clear()
+            else:
+                entries.pop(key, None)
+            self._save()
+        logger.info(f"Invalidated cache {self.name}[{key or '*'}].")
+
+
+_caches: Dict[str, PersistentCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str, ttl: Optional[float] = None) -> PersistentCache:
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = PersistentCache(name, ttl)
+        return _caches[name]
@@ -1,19 +1,40 @@
 import os
-from typing import NamedTuple, TypeVar, Type
-
-import yaml
+import threading
+from typing import Callable, Dict, NamedTuple, Optional, TypeVar, Type
 
 
 class Config(NamedTuple):
+    """Settings shared by every pipeline."""
+
+    cache_dir: str
+    state_verify_interval: float
+    api_endpoint: str
+
+
+class SentryConfig(NamedTuple):
+    dsn: str
+    traces_sample_rate: float
+
+
+class TodoistConfig(NamedTuple):
+    access_token: str
+    project_name: str
+    label: str
+    default_priority: str
+    incremental_sync: bool
+
+
+class GoogleCalendarConfig(NamedTuple):
     gcp_client_id: str
     gcp_client_secret: str
-    google_calendar_refresh_token: str
-    google_calendar_id: str
-    todoist_access_token: str
-    todoist_project_name: str
-    todoist_label: str
-    todoist_default_priority: str
-    github_classic_token: str
+    refresh_token: str
+    calendar_id: str
+    incremental_sync: bool
+
+
+class GitHubConfig(NamedTuple):
+    classic_token: str
+    use_graphql: bool
 
 
 Undefined = object()
@@ -27,53 +48,141 @@ def read_from_any(
 ) -> Expected:
     value = default
     for dikt in dicts:
-        if key in dikt:
-            value = dikt[key]
-        if key.lower() in dikt:
-            value = dikt[key.lower()]
-        if key.upper() in dikt:
-            value = dikt[key.upper()]
+        for candidate in (key, key.lower(), key.upper()):
+            if candidate in dikt:
+                value = dikt[candidate]
+    if value is Undefined:
+        raise KeyError(f"Key {key} not found.")
+    if isinstance(value, str):
         value = value.strip()
     if expected is list and isinstance(value, str):
         value = [v.strip() for v in value.split(",")]
     if not isinstance(value, expected):
         raise ValueError(f"{key} expected to be a {expected} but is {type(value)}")
-    if value is not Undefined:
-        return value
-    raise KeyError(f"Key {key} not found.")
+    return value
+
+
+def read_flag(key: str, *dicts, default: bool) -> bool:
+    value = read_from_any(key, *dicts, default=str(default))
+    return value.lower() in ("1", "true", "yes", "on")
+
 
+def read_yaml() -> Dict:
+    import yaml  # only needed here, keep it out of the CLI import path
 
-def read_config() -> Config:
     try:
         file = open(os.path.expanduser("~/wrike-todoist.yml"))
         read_from_yaml = yaml.safe_load(file)
     except IOError:
         read_from_yaml = {}
+    # Values are read as strings, like the environment
+    return {key: str(value) for key, value in (read_from_yaml or {}).items()}
+
+
+def read_config(read_from_yaml: Dict) -> Config:
     return Config(
+        cache_dir=os.path.expanduser(
+            read_from_any(
+                "wrike_todoist_cache_dir",
+                os.environ,
+                read_from_yaml,
+                default="~/.cache/wrike-todoist",
+            )
+        ),
+        state_verify_interval=float(
+            read_from_any("state_verify_interval", os.environ, read_from_yaml, default="3600")
+        ),
+        # Sends the requests of every upstream to this base URL instead, e.g. a local fake server
+        api_endpoint=read_from_any(
+            "wrike_todoist_api_endpoint", os.environ, read_from_yaml, default=""
+        ).rstrip("/"),
+    )
+
+
+def read_sentry_config(read_from_yaml: Dict) -> SentryConfig:
+    return SentryConfig(
+        dsn=read_from_any("sentry_dsn", os.environ, read_from_yaml, default=""),
+        traces_sample_rate=float(
+            read_from_any("sentry_traces_sample_rate", os.environ, read_from_yaml, default="0")
+        ),
+    )
+
+
+def read_todoist_config(read_from_yaml: Dict) -> TodoistConfig:
+    return TodoistConfig(
+        access_token=read_from_any(
+            "todoist_access_token", os.environ, read_from_yaml
+        ),
+        project_name=read_from_any("todoist_project_name", os.environ, read_from_yaml, default=""),
+        label=read_from_any("todoist_label", os.environ, read_from_yaml, default=""),
+        default_priority=read_from_any(
+            "todoist_default_priority", os.environ, read_from_yaml, default="P4"
+        ),
+        incremental_sync=read_flag(
+            "todoist_incremental_sync", os.environ, read_from_yaml, default=True
+        ),
+    )
+
+
+def read_google_calendar_config(read_from_yaml: Dict) -> GoogleCalendarConfig:
+    return GoogleCalendarConfig(
         gcp_client_id=read_from_any("gcp_client_id", os.environ, read_from_yaml),
         gcp_client_secret=read_from_any(
             "gcp_client_secret", os.environ, read_from_yaml
         ),
-        google_calendar_id=read_from_any(
-            "google_calendar_id", os.environ, read_from_yaml
-        ),
-        google_calendar_refresh_token=read_from_any(
+        refresh_token=read_from_any(
             "google_calendar_refresh_token", os.environ, read_from_yaml
         ),
-        todoist_access_token=read_from_any(
-            "todoist_access_token", os.environ, read_from_yaml
-        ),
-        todoist_project_name=read_from_any(
-            "todoist_project_name", os.environ, read_from_yaml
+        calendar_id=read_from_any(
+            "google_calendar_id", os.environ, read_from_yaml
         ),
-        todoist_label=read_from_any("todoist_label", os.environ, read_from_yaml),
-        todoist_default_priority=read_from_any(
-            "todoist_default_priority", os.environ, read_from_yaml, default="P4"
+        incremental_sync=read_flag(
+            "google_calendar_incremental_sync", os.environ, read_from_yaml, default=True
         ),
-        github_classic_token=read_from_any(
+    )
+
+
+def read_github_config(read_from_yaml: Dict) -> GitHubConfig:
+    return GitHubConfig(
+        classic_token=read_from_any(
             "github_classic_token", os.environ, read_from_yaml
         ),
+        use_graphql=read_flag(
+            "github_use_graphql", os.environ, read_from_yaml, default=True
+        ),
     )
 
 
-config = read_config()
+# Each section is read on first access of `config.<section>`, so a pipeline only needs its own settings
+SECTIONS: Dict[str, Callable[[Dict], NamedTuple]] = {
+    "config": read_config,
+    "todoist": read_todoist_config,
+    "google_calendar": read_google_calendar_config,
+    "github": read_github_config,
+    "sentry": read_sentry_config,
+}
+
+_yaml: Optional[Dict] = None
+_loaded: Dict[str, NamedTuple] = {}
+_config_lock = threading.Lock()
+
+
+def get_section(name: str) -> NamedTuple:
+    global _yaml
+    with _config_lock:
+        if name not in _loaded:
+            if _yaml is None:
+                _yaml = read_yaml()
+            _loaded[name] = SECTIONS[name](_yaml)
+        return _loaded[name]
+
+
+def get_config() -> Config:
+    return get_section("config")
+
+
+def __getattr__(name: str):
+    # Config is read on first access of `config.config` (or another section), not on import
+    if name in SECTIONS:
+        return get_section(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
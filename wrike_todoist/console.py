@@ -1,112 +1,364 @@
+import concurrent.futures
+import contextvars
+import itertools
 import logging
+import random
+import signal
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
 
 import click
-import pendulum
 
-from wrike_todoist import config
-from wrike_todoist.google_calendar import api as google_calendar_api
-from wrike_todoist.todoist import api as todoist_api, models as todoist_models
-from wrike_todoist.harmonogram import api as harmonogram_api
-from wrike_todoist.github import api as github_api
+from wrike_todoist import metrics
 
 logger = logging.getLogger(__name__)
 
+# Adapters (and the Google, pendulum and requests imports behind them) are imported inside the pipelines,
+# so a run only pays for the pipelines it has enabled.
 
-def google_calendar_todoist_main():
-    calendar_events = google_calendar_api.pull_todays_events()
-    calendar_events = calendar_events.filter(
-        lambda event: event.eventType == "default" and event.kind == "calendar#event"
+plan_only: contextvars.ContextVar[bool] = contextvars.ContextVar("plan_only", default=False)
+
+
+def is_in_sync(source: str, expected_todoist_tasks) -> bool:
+    """The state store skip, bypassed under --plan so a preview is always diffed against Todoist."""
+    from wrike_todoist.todoist import state as todoist_state
+
+    return not plan_only.get() and todoist_state.is_in_sync(source, expected_todoist_tasks)
+
+
+def reconcile_and_apply(source: str, expected_todoist_tasks, actual_todoist_tasks, policy):
+    """
+    Reconcile the actual Todoist tasks with the expected ones and apply the resulting plan, or with --plan
+    only write the plan for review and print it.
+
+    The reconciliation is streamed straight into the plan, `actual_todoist_tasks` may be a lazy iterator.
+    """
+    from wrike_todoist import tracing
+    from wrike_todoist.todoist import (
+        api as todoist_api,
+        models as todoist_models,
+        plan as todoist_plan,
+        state as todoist_state,
     )
 
+    with tracing.span("compare", "Expected and actual Todoist tasks") as span:
+        reconciliations = todoist_models.TodoistTaskCollection.reconcile(
+            expected_todoist_tasks, actual_todoist_tasks, policy
+        )
+        reconciled = todoist_api.todoist_plan_reconciliations(source, reconciliations, policy.remove_closed)
+        tracing.set_counts(span, reconciled.planned)
+    metrics.observe_mutations(source, "planned", reconciled.planned)
+    sync_plan = reconciled.sync_plan
+    if plan_only.get():
+        todoist_plan.write_preview(sync_plan)
+        click.echo("\n".join(sync_plan.describe(todoist_api.TODOIST_SYNC_BATCH_SIZE)))
+        return
+
+    with tracing.span("apply", "Todoist sync plan", commands=len(sync_plan.commands)) as span:
+        applied = todoist_api.todoist_apply_plan(sync_plan)
+        tracing.set_counts(span, applied.counts())
+    metrics.observe_mutations(source, "applied", applied.counts())
+    todoist_state.record_sync(source, expected_todoist_tasks, reconciled, applied)
+
+
+def apply_previewed_plan(source: str):
+    """Apply the plan an earlier --plan run wrote for review."""
+    from wrike_todoist import tracing
+    from wrike_todoist.todoist import api as todoist_api, state as todoist_state
+
+    with tracing.span("apply", "Previewed Todoist sync plan") as span:
+        applied = todoist_api.todoist_apply_preview(source)
+        tracing.set_counts(span, applied.counts())
+    metrics.observe_mutations(source, "applied", applied.counts())
+    # The preview was computed from older source data, so let the next run verify against Todoist
+    todoist_state.get_state_store().forget(source)
+
+
+def resume_pending_plan(source: str) -> bool:
+    """Finish a plan an earlier run was interrupted in, instead of fetching and diffing again."""
+    from wrike_todoist.todoist import api as todoist_api, state as todoist_state
+
+    applied = todoist_api.todoist_resume_plan(source)
+    if applied is None:
+        return False
+    metrics.observe_mutations(source, "applied", applied.counts())
+    # The resumed plan was computed from older source data, so let the next run verify against Todoist
+    todoist_state.get_state_store().forget(source)
+    return True
+
+
+def google_calendar_todoist_main():
+    import pendulum
+
+    from wrike_todoist import tracing
+    from wrike_todoist.google_calendar import api as google_calendar_api
+    from wrike_todoist.todoist import api as todoist_api, models as todoist_models
+
+    with tracing.span("fetch.source", "Google Calendar events") as span:
+        calendar_events = google_calendar_api.pull_todays_events()
+        calendar_events = calendar_events.filter(
+            lambda event: event.eventType == "default" and event.kind == "calendar#event"
+        )
+        span.set_data("items", len(calendar_events))
+
     todoist_project = todoist_api.todoist_get_project_by_name(
         "Calendar"  # @TODO: Parametrize
     )
-    actual_todoist_tasks = todoist_api.todoist_get_tasks(
-        todoist_project, only_due_today=True
-    )
-    actual_todoist_tasks_only_due_today = actual_todoist_tasks.filter(
-        lambda task: task.due and task.due.date.date() == pendulum.today().date()
-    )
-    actual_todoist_tasks_completed_today = todoist_api.todoist_get_completed_tasks(
-        todoist_project, since=pendulum.today()
-    )
-    actual_todoist_tasks = (
-        actual_todoist_tasks_only_due_today + actual_todoist_tasks_completed_today
-    ).distinct()
-    expected_todoist_tasks = todoist_models.TodoistTaskCollection.from_calendar_events(
-        calendar_events, todoist_project.id
-    )
+    with tracing.span("parse", "Calendar events to Todoist tasks") as span:
+        expected_todoist_tasks = todoist_models.TodoistTaskCollection.from_calendar_events(
+            calendar_events, todoist_project.id
+        )
+        span.set_data("items", len(expected_todoist_tasks))
+    if is_in_sync("google_calendar", expected_todoist_tasks):
+        logger.info("Calendar events unchanged since the last verified sync, skipping.")
+        return
 
-    comparison_result = todoist_models.TodoistTaskCollection.compare_calendar(
-        expected_todoist_tasks, actual_todoist_tasks
+    with tracing.span("fetch.todoist", "Completed Todoist tasks") as span:
+        actual_todoist_tasks_completed_today = todoist_api.todoist_get_completed_tasks(
+            todoist_project, since=pendulum.today()
+        )
+        span.set_data("items", len(actual_todoist_tasks_completed_today))
+    # Active tasks are read while reconciling, completed ones come last so they win over an active duplicate
+    actual_todoist_tasks_only_due_today = (
+        task
+        for task in todoist_api.todoist_iter_tasks(todoist_project, only_due_today=True)
+        if task.due and task.due.date.date() == pendulum.today().date()
+    )
+    reconcile_and_apply(
+        "google_calendar",
+        expected_todoist_tasks,
+        itertools.chain(actual_todoist_tasks_only_due_today, actual_todoist_tasks_completed_today),
+        todoist_models.CALENDAR_POLICY,
     )
-
-    todoist_api.todoist_create_tasks(comparison_result.to_add)
-    todoist_api.todoist_update_tasks(comparison_result.to_update)
-    todoist_api.todoist_remove_tasks(comparison_result.to_close)
 
 
 def harmonogram_main():
-    street_id = harmonogram_api.find_street_id("Potockiego")
-    logger.info(f"Found street id {street_id}")
+    import pendulum
 
-    collection_days = harmonogram_api.pull_future_collection_days(street_id)
+    from wrike_todoist import tracing
+    from wrike_todoist.harmonogram import api as harmonogram_api
+    from wrike_todoist.todoist import api as todoist_api, models as todoist_models
+
+    with tracing.span("fetch.source", "Harmonogram collection days") as span:
+        collection_days = harmonogram_api.get_future_collection_days("Potockiego")
+        span.set_data("items", len(collection_days))
 
     todoist_project = todoist_api.todoist_get_project_by_name(
         "Śmieci"  # @TODO: Parametrize
     )
-    actual_todoist_tasks_active = todoist_api.todoist_get_tasks(todoist_project)
-    actual_todoist_tasks_completed_last_seven_days = (
-        todoist_api.todoist_get_completed_tasks(
-            todoist_project, since=pendulum.today().subtract(days=7)
+    with tracing.span("parse", "Collection days to Todoist tasks") as span:
+        expected_todoist_tasks = todoist_models.TodoistTaskCollection.from_harmonogram(
+            collection_days, todoist_project.id
         )
-    )
-    actual_todoist_tasks = (
-        actual_todoist_tasks_active + actual_todoist_tasks_completed_last_seven_days
-    ).distinct()
+        span.set_data("items", len(expected_todoist_tasks))
+    if is_in_sync("harmonogram", expected_todoist_tasks):
+        logger.info("Collection days unchanged since the last verified sync, skipping.")
+        return
 
-    expected_todoist_tasks = todoist_models.TodoistTaskCollection.from_harmonogram(
-        collection_days, todoist_project.id
+    with tracing.span("fetch.todoist", "Completed Todoist tasks") as span:
+        actual_todoist_tasks_completed_last_seven_days = (
+            todoist_api.todoist_get_completed_tasks(
+                todoist_project, since=pendulum.today().subtract(days=7)
+            )
+        )
+        span.set_data("items", len(actual_todoist_tasks_completed_last_seven_days))
+    reconcile_and_apply(
+        "harmonogram",
+        expected_todoist_tasks,
+        itertools.chain(
+            todoist_api.todoist_iter_tasks(todoist_project), actual_todoist_tasks_completed_last_seven_days
+        ),
+        todoist_models.HARMONOGRAM_POLICY,
     )
 
-    comparison_result = todoist_models.TodoistTaskCollection.compare_harmonogram(
-        expected_todoist_tasks, actual_todoist_tasks
-    )
 
-    todoist_api.todoist_remove_tasks(comparison_result.to_close)
-    todoist_api.todoist_create_tasks(comparison_result.to_add)
-    todoist_api.todoist_update_tasks(comparison_result.to_update)
+def github_todoist_main():
+    import pendulum
 
+    from wrike_todoist import tracing
+    from wrike_todoist.github import api as github_api
+    from wrike_todoist.todoist import api as todoist_api, models as todoist_models
 
-def github_todoist_main():
-    current_user = github_api.github_get_authenticated_user()
-    github_items = github_api.github_get_all_items(current_user)
+    # The stats are logged per run, so the daemon doesn't report totals since it started
+    github_api.conditional_cache_stats.reset()
+    with tracing.span("fetch.source", "GitHub issues, pull requests and alerts") as span:
+        current_user = github_api.github_get_authenticated_user()
+        github_items = github_api.github_get_all_items(current_user)
+        span.set_data("items", len(github_items))
 
     todoist_project = todoist_api.todoist_get_project_by_name(
         "GitHub"  # @TODO: Parametrize
     )
-    actual_todoist_tasks_active = todoist_api.todoist_get_tasks(todoist_project)
-    actual_todoist_tasks_completed_last_day = (
-        todoist_api.todoist_get_completed_tasks(
-            todoist_project, since=pendulum.today().subtract(days=1)
+    with tracing.span("parse", "GitHub items to Todoist tasks") as span:
+        expected_todoist_tasks = todoist_models.TodoistTaskCollection.from_github_items(
+            github_items, todoist_project.id
         )
-    )
-    actual_todoist_tasks = (
-        actual_todoist_tasks_active + actual_todoist_tasks_completed_last_day
-    ).distinct()
+        span.set_data("items", len(expected_todoist_tasks))
+    if is_in_sync("github", expected_todoist_tasks):
+        logger.info("GitHub items unchanged since the last verified sync, skipping.")
+        github_api.log_conditional_cache_stats()
+        return
 
-    expected_todoist_tasks = todoist_models.TodoistTaskCollection.from_github_items(
-        github_items, todoist_project.id
+    with tracing.span("fetch.todoist", "Completed Todoist tasks") as span:
+        actual_todoist_tasks_completed_last_day = (
+            todoist_api.todoist_get_completed_tasks(
+                todoist_project, since=pendulum.today().subtract(days=1)
+            )
+        )
+        span.set_data("items", len(actual_todoist_tasks_completed_last_day))
+    reconcile_and_apply(
+        "github",
+        expected_todoist_tasks,
+        itertools.chain(todoist_api.todoist_iter_tasks(todoist_project), actual_todoist_tasks_completed_last_day),
+        todoist_models.GITHUB_POLICY,
     )
+    github_api.log_conditional_cache_stats()
 
-    comparison_result = todoist_models.TodoistTaskCollection.compare_github(
-        expected_todoist_tasks, actual_todoist_tasks
-    )
 
-    todoist_api.todoist_reopen_tasks(comparison_result.to_reopen)
-    todoist_api.todoist_create_tasks(comparison_result.to_add)
-    todoist_api.todoist_update_tasks(comparison_result.to_update)
-    todoist_api.todoist_close_tasks(comparison_result.to_close)
+PIPELINES: Dict[str, Callable[[], None]] = {
+    "google_calendar": google_calendar_todoist_main,
+    "harmonogram": harmonogram_main,
+    "github": github_todoist_main,
+}
+
+current_pipeline: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_pipeline", default="main"
+)
+
+
+class PipelineLogFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.pipeline = current_pipeline.get()
+        return True
+
+
+class PipelineResult(NamedTuple):
+    name: str
+    duration: float
+    error: Optional[Exception]
+
+
+def run_pipeline(name: str, plan: bool = False, apply_plan: bool = False) -> PipelineResult:
+    from wrike_todoist import tracing
+
+    current_pipeline.set(name)
+    plan_only.set(plan)
+    started = time.monotonic()
+    error = None
+    with tracing.transaction(name) as transaction:
+        try:
+            if apply_plan:
+                # An interrupted apply is finished first, its journal would be dropped by the new plan
+                resume_pending_plan(name)
+                apply_previewed_plan(name)
+            elif plan or not resume_pending_plan(name):
+                PIPELINES[name]()
+        except Exception as e:
+            logger.exception(f"Pipeline {name} failed.")
+            transaction.set_status("internal_error")
+            error = e
+    duration = time.monotonic() - started
+    metrics.observe_pipeline_run(name, duration, failed=error is not None)
+    return PipelineResult(name=name, duration=duration, error=error)
+
+
+def init_tracing():
+    from wrike_todoist import tracing
+
+    tracing.init()
+
+
+def log_connection_stats():
+    from wrike_todoist import api_utils
+
+    api_utils.log_connection_stats()
+
+
+def log_pipeline_result(result: PipelineResult):
+    status = "failed" if result.error else "finished"
+    logger.info(f"Pipeline {result.name} {status} in {result.duration:.2f}s.")
+
+
+def run_pipelines(
+    names: List[str], jobs: int = 1, plan: bool = False, apply_plan: bool = False
+) -> List[PipelineResult]:
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(jobs, 1), thread_name_prefix="pipeline"
+    ) as executor:
+        # Each run gets a copy of the caller's context, so the variables it sets don't leak into the next run
+        # that reuses the worker thread
+        futures = [
+            executor.submit(contextvars.copy_context().run, run_pipeline, name, plan, apply_plan) for name in names
+        ]
+        results = [future.result() for future in futures]
+
+    for result in results:
+        log_pipeline_result(result)
+    return results
+
+
+def write_metrics(metrics_file: Optional[str]):
+    if metrics_file is None:
+        return
+    try:
+        metrics.write_textfile(metrics_file)
+    except OSError:
+        logger.exception(f"Failed to write metrics to {metrics_file}.")
+
+
+def run_daemon(
+    intervals: Dict[str, float],
+    jobs: int = 1,
+    jitter: float = 0.1,
+    metrics_file: Optional[str] = None,
+    metrics_port: Optional[int] = None,
+):
+    """
+    Run each pipeline every `intervals[name]` seconds (+/- `jitter` of it) until SIGTERM or SIGINT.
+
+    Sessions, the calendar service and caches stay warm between runs. A pipeline that is still running
+    when it is due again is skipped for that round instead of being started twice. Metrics are served on
+    `metrics_port` and/or rewritten to `metrics_file` after every pipeline run.
+    """
+    stop = threading.Event()
+    metrics_server = metrics.serve(metrics_port) if metrics_port is not None else None
+
+    def on_pipeline_done(done: concurrent.futures.Future):
+        log_pipeline_result(done.result())
+        write_metrics(metrics_file)
+
+    def request_stop(signum, frame):
+        logger.info(f"Received signal {signum}, stopping once running pipelines finish.")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    next_runs = {name: time.monotonic() for name in intervals}
+    running: Dict[str, concurrent.futures.Future] = {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1), thread_name_prefix="pipeline")
+
+    try:
+        while not stop.is_set():
+            now = time.monotonic()
+            for name, interval in intervals.items():
+                if now < next_runs[name]:
+                    continue
+                future = running.get(name)
+                if future is not None and not future.done():
+                    logger.warning(f"Pipeline {name} is still running, skipping this round.")
+                else:
+                    running[name] = executor.submit(contextvars.copy_context().run, run_pipeline, name)
+                    running[name].add_done_callback(on_pipeline_done)
+                next_runs[name] = now + interval * random.uniform(1 - jitter, 1 + jitter)
+            stop.wait(max(0.0, min(next_runs.values()) - time.monotonic()))
+    finally:
+        logger.info("Waiting for running pipelines to finish.")
+        executor.shutdown(wait=True, cancel_futures=True)
+        log_connection_stats()
+        if metrics_server is not None:
+            metrics_server.shutdown()
 
 
 @click.command()
@@ -119,11 +371,120 @@ def github_todoist_main():
     help="Run google_calendar_todoist_main",
 )
 @click.option("--github/--no-github", default=True, help="Run github_todoist_main")
-def main(harmonogram, google_calendar, github):
-    logging.basicConfig(level=logging.INFO)
-    if google_calendar:
-        google_calendar_todoist_main()
-    if harmonogram:
-        harmonogram_main()
-    if github:
-        github_todoist_main()
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of pipelines to run concurrently",
+)
+@click.option(
+    "--daemon", is_flag=True, help="Keep running and poll each pipeline on its own interval"
+)
+@click.option(
+    "--plan",
+    is_flag=True,
+    help="Only compute and print the Todoist mutations, and keep them for review",
+)
+@click.option(
+    "--apply-plan",
+    is_flag=True,
+    help="Apply the mutations printed by the last --plan run instead of computing new ones",
+)
+@click.option(
+    "--google-calendar-interval",
+    default=300,
+    show_default=True,
+    type=click.FloatRange(min=1),
+    help="Seconds between google_calendar_todoist_main runs in daemon mode",
+)
+@click.option(
+    "--harmonogram-interval",
+    default=6 * 60 * 60,
+    show_default=True,
+    type=click.FloatRange(min=1),
+    help="Seconds between harmonogram_main runs in daemon mode",
+)
+@click.option(
+    "--github-interval",
+    default=300,
+    show_default=True,
+    type=click.FloatRange(min=1),
+    help="Seconds between github_todoist_main runs in daemon mode",
+)
+@click.option(
+    "--jitter",
+    default=0.1,
+    show_default=True,
+    type=click.FloatRange(min=0, max=1),
+    help="Randomize daemon intervals by this fraction",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False),
+    help="Write Prometheus metrics to this file after the runs, e.g. for the node_exporter textfile collector",
+)
+@click.option(
+    "--metrics-port",
+    type=click.IntRange(min=0, max=65535),
+    help="Serve Prometheus metrics on this port at /metrics in daemon mode",
+)
+def main(
+    harmonogram,
+    google_calendar,
+    github,
+    jobs,
+    daemon,
+    plan,
+    apply_plan,
+    google_calendar_interval,
+    harmonogram_interval,
+    github_interval,
+    jitter,
+    metrics_file,
+    metrics_port,
+):
+    logging.basicConfig(
+        level=logging.INFO, format="%(levelname)s:%(pipeline)s:%(name)s:%(message)s"
+    )
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(PipelineLogFilter())
+    init_tracing()
+
+    if daemon and (plan or apply_plan):
+        raise click.UsageError("--plan and --apply-plan cannot be combined with --daemon.")
+    if plan and apply_plan:
+        raise click.UsageError("--plan cannot be combined with --apply-plan.")
+    if metrics_port is not None and not daemon:
+        raise click.UsageError("--metrics-port requires --daemon, use --metrics-file for single runs.")
+
+    enabled = {
+        "google_calendar": google_calendar,
+        "harmonogram": harmonogram,
+        "github": github,
+    }
+    if daemon and not any(enabled.values()):
+        raise click.UsageError("--daemon needs at least one enabled pipeline.")
+    if daemon:
+        intervals = {
+            "google_calendar": google_calendar_interval,
+            "harmonogram": harmonogram_interval,
+            "github": github_interval,
+        }
+        run_daemon(
+            {name: interval for name, interval in intervals.items() if enabled[name]},
+            jobs,
+            jitter,
+            metrics_file,
+            metrics_port,
+        )
+        return
+
+    results = run_pipelines([name for name, is_enabled in enabled.items() if is_enabled], jobs, plan, apply_plan)
+    log_connection_stats()
+    write_metrics(metrics_file)
+
+    failed = [result.name for result in results if result.error]
+    if failed:
+        raise click.ClickException(f"Failed pipelines: {', '.join(failed)}")
@@ -1,108 +1,407 @@
+import asyncio
+import collections
+import http
+import itertools
 import logging
+import threading
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
 
 import requests
 
-from wrike_todoist import config
-from wrike_todoist.api_utils import response_to_json_value
+from wrike_todoist import config, metrics
+from wrike_todoist.api_utils import JSONValue, async_request, get_session, response_to_json_value, run_sync
+from wrike_todoist.cache import get_cache
 from wrike_todoist.github import models
 
 logger = logging.getLogger(__name__)
 
+GITHUB_API_BASE = "https://api.github.com"
+GITHUB_PREFETCH_PAGES = 4
 
-def github_get_authenticated_user() -> models.GitHubUser:
-    """Fetch the authenticated user."""
-    response = requests.get(
-        "https://api.github.com/user",
-        headers={"Authorization": f"Bearer {config.config.github_classic_token}"},
+
+def github_session() -> requests.Session:
+    return get_session(
+        GITHUB_API_BASE,
+        headers={"Authorization": f"Bearer {config.github.classic_token}"},
     )
-    return models.GitHubUser.from_response(response_to_json_value(response))
 
 
-def github_get_assigned_issues(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
+class ConditionalCacheStats:
+    def __init__(self):
+        self.requests = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool):
+        with self._lock:
+            self.requests += 1
+            self.hits += int(hit)
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.hits = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hits / self.requests if self.requests else 0.0
+
+
+conditional_cache_stats = ConditionalCacheStats()
+
+
+class GitHubPage(NamedTuple):
+    body: JSONValue
+    links: Dict[str, str]  # rel -> url, from the Link header
+
+
+def parse_link_header(link_header: Optional[str]) -> Dict[str, str]:
+    return {
+        link["rel"]: link["url"]
+        for link in requests.utils.parse_header_links(link_header or "")
+        if "rel" in link
+    }
+
+
+def _select_fields(body: JSONValue, results_key: Optional[str], fields: Optional[Tuple[str, ...]]) -> JSONValue:
+    """Keep only `fields` of every item in a list page, the rest of a response is not needed downstream."""
+    if fields is None:
+        return body
+    items = body.get(results_key, []) if results_key else body
+    items = [{field: item[field] for field in fields if field in item} for item in items]
+    return {results_key: items} if results_key else items
+
+
+async def async_github_get_page(
+    url: str,
+    params: Optional[Dict] = None,
+    results_key: Optional[str] = None,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> GitHubPage:
+    """
+    GET a GitHub resource through the persistent ETag / Last-Modified cache.
+
+    A 304 Not Modified is served from the cache and does not count against the rate limit. With `fields`,
+    the items of a list page are cut down to those fields before they are cached and returned.
+    """
+    cache = get_cache("github_conditional")
+    cache_key = f"{url}?{urlencode(sorted((params or {}).items()))}"
+    cached = cache.get(cache_key)
+
+    headers = {}
+    if cached is not None:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = await async_request(github_session(), "GET", url, params=params, headers=headers)
+    if cached is not None and response.status_code == http.HTTPStatus.NOT_MODIFIED:
+        conditional_cache_stats.record(hit=True)
+        return GitHubPage(body=cached["body"], links=parse_link_header(cached.get("link")))
+
+    body = _select_fields(response_to_json_value(response), results_key, fields)
+    conditional_cache_stats.record(hit=False)
+    if response.headers.get("ETag") or response.headers.get("Last-Modified"):
+        cache.set(
+            cache_key,
+            {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "link": response.headers.get("Link"),
+                "body": body,
+            },
+        )
+    return GitHubPage(body=body, links=parse_link_header(response.headers.get("Link")))
+
+
+async def async_github_get_json(url: str, params: Optional[Dict] = None) -> JSONValue:
+    return (await async_github_get_page(url, params)).body
+
+
+def _page_items(url: str, page: GitHubPage, results_key: Optional[str]) -> List[Dict]:
+    metrics.observe_page(url)
+    return page.body.get(results_key, []) if results_key else page.body
+
+
+def _last_page_number(links: Dict[str, str]) -> Optional[int]:
+    if "last" not in links:
+        return None
+    page = parse_qs(urlsplit(links["last"]).query).get("page")
+    return int(page[0]) if page else None
+
+
+async def async_github_paginate(
+    url: str,
+    params: Optional[Dict] = None,
+    results_key: Optional[str] = None,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> AsyncIterator[Dict]:
+    """
+    Yield items of a GitHub list or search endpoint, following the Link header.
+
+    When the first page links to a numbered last page, up to GITHUB_PREFETCH_PAGES following pages are
+    requested ahead; otherwise (e.g. cursor-paginated endpoints) rel="next" is followed one page at a time.
+    Items only carry `fields`, when given.
+    """
+    page = await async_github_get_page(url, params, results_key, fields)
+    for item in _page_items(url, page, results_key):
+        yield item
+
+    def fetch(page_number: int) -> "asyncio.Future[GitHubPage]":
+        page_params = {**(params or {}), "page": page_number}
+        return asyncio.ensure_future(async_github_get_page(url, page_params, results_key, fields))
+
+    last_page_number = _last_page_number(page.links)
+    if last_page_number is not None:
+        page_numbers = iter(range(2, last_page_number + 1))
+        prefetched = collections.deque(
+            fetch(page_number) for page_number in itertools.islice(page_numbers, GITHUB_PREFETCH_PAGES)
+        )
+        try:
+            while prefetched:
+                page = await prefetched.popleft()
+                next_page_number = next(page_numbers, None)
+                if next_page_number is not None:
+                    prefetched.append(fetch(next_page_number))
+                for item in _page_items(url, page, results_key):
+                    yield item
+        finally:
+            for future in prefetched:
+                future.cancel()
+        return
+
+    while "next" in page.links:
+        page = await async_github_get_page(page.links["next"], None, results_key, fields)
+        for item in _page_items(url, page, results_key):
+            yield item
+
+
+def log_conditional_cache_stats():
+    logger.info(
+        f"GitHub conditional cache: {conditional_cache_stats.hits}/{conditional_cache_stats.requests} "
+        f"requests served from cache ({conditional_cache_stats.hit_ratio:.0%})."
+    )
+
+
+async def async_github_get_authenticated_user() -> models.GitHubUser:
+    """Fetch the authenticated user."""
+    return models.GitHubUser.from_response(await async_github_get_json(f"{GITHUB_API_BASE}/user"))
+
+
+def github_get_authenticated_user() -> models.GitHubUser:
+    return run_sync(async_github_get_authenticated_user())
+
+
+async def async_github_get_assigned_issues(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
     """Get all open issues and PRs assigned to the authenticated user."""
-    github_issues_response = requests.get(
-        "https://api.github.com/issues",
+    github_issue_collection = models.GitHubIssueCollection()
+    async for github_issue in async_github_paginate(
+        f"{GITHUB_API_BASE}/issues",
         params={
             "filter": "assigned",
             "state": "open",
             "per_page": 100,
         },
-        headers={"Authorization": f"Bearer {config.config.github_classic_token}"},
-    )
-    github_issue_collection = models.GitHubIssueCollection.from_response(
-        response_to_json_value(github_issues_response), current_user
-    )
+        fields=models.ISSUE_RESPONSE_FIELDS,
+    ):
+        github_issue_collection += models.GitHubIssue.from_response(github_issue, current_user)
     logger.info(f"Retrieved {len(github_issue_collection)} assigned GitHub issues/PRs.")
     return github_issue_collection
 
 
-def github_get_review_requests(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
+def github_get_assigned_issues(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
+    return run_sync(async_github_get_assigned_issues(current_user))
+
+
+async def async_github_get_review_requests(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
     """Get all open non-draft PRs where the authenticated user has been requested for review."""
-    github_review_requests_response = requests.get(
-        "https://api.github.com/search/issues",
+    github_review_request_collection = models.GitHubIssueCollection()
+    async for github_issue in async_github_paginate(
+        f"{GITHUB_API_BASE}/search/issues",
         params={
             "q": "is:open is:pr draft:false review-requested:@me",
             "per_page": 100,
         },
-        headers={"Authorization": f"Bearer {config.config.github_classic_token}"},
-    )
-    response_data = response_to_json_value(github_review_requests_response)
-    github_review_request_collection = models.GitHubIssueCollection.from_response(
-        response_data.get("items", []), current_user
-    )
+        results_key="items",
+        fields=models.ISSUE_RESPONSE_FIELDS,
+    ):
+        github_review_request_collection += models.GitHubIssue.from_response(github_issue, current_user)
     logger.info(f"Retrieved {len(github_review_request_collection)} GitHub review requests.")
     return github_review_request_collection
 
 
-def github_get_created_prs(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
+def github_get_review_requests(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
+    return run_sync(async_github_get_review_requests(current_user))
+
+
+async def async_github_get_created_prs(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
     """Get all open non-draft PRs created by the authenticated user."""
-    github_created_prs_response = requests.get(
-        "https://api.github.com/search/issues",
+    github_created_pr_collection = models.GitHubIssueCollection()
+    async for github_issue in async_github_paginate(
+        f"{GITHUB_API_BASE}/search/issues",
         params={
             "q": "is:open is:pr draft:false author:@me",
             "per_page": 100,
         },
-        headers={"Authorization": f"Bearer {config.config.github_classic_token}"},
-    )
-    response_data = response_to_json_value(github_created_prs_response)
-    github_created_pr_collection = models.GitHubIssueCollection.from_response(
-        response_data.get("items", []), current_user
-    )
+        results_key="items",
+        fields=models.ISSUE_RESPONSE_FIELDS,
+    ):
+        github_created_pr_collection += models.GitHubIssue.from_response(github_issue, current_user)
     logger.info(f"Retrieved {len(github_created_pr_collection)} GitHub PRs created by user.")
     return github_created_pr_collection
 
 
+def github_get_created_prs(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
+    return run_sync(async_github_get_created_prs(current_user))
+
+
 DEPENDABOT_REPOS = ["bidnamic/shift"]
 
 
-def github_get_dependabot_alerts(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
-    """Get open Dependabot alerts assigned to the authenticated user."""
+async def _async_github_get_repo_dependabot_alerts(current_user: models.GitHubUser, repo: str) -> list:
     issues = []
-    for repo in DEPENDABOT_REPOS:
-        response = requests.get(
-            f"https://api.github.com/repos/{repo}/dependabot/alerts",
-            params={
-                "state": "open",
-                "per_page": 100,
-            },
-            headers={"Authorization": f"Bearer {config.config.github_classic_token}"},
-        )
-        alerts = response_to_json_value(response)
-        for alert in alerts:
-            assignee_logins = [a["login"] for a in alert.get("assignees", [])]
-            if current_user.login in assignee_logins:
-                issues.append(models.GitHubIssue.from_dependabot_alert(alert, repo))
+    async for alert in async_github_paginate(
+        f"{GITHUB_API_BASE}/repos/{repo}/dependabot/alerts",
+        params={
+            "state": "open",
+            "per_page": 100,
+        },
+        fields=models.DEPENDABOT_ALERT_FIELDS,
+    ):
+        assignee_logins = [a["login"] for a in alert.get("assignees", [])]
+        if current_user.login in assignee_logins:
+            issues.append(models.GitHubIssue.from_dependabot_alert(alert, repo))
+    return issues
+
+
+async def async_github_get_dependabot_alerts(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
+    """Get open Dependabot alerts assigned to the authenticated user."""
+    per_repo_issues = await asyncio.gather(
+        *[_async_github_get_repo_dependabot_alerts(current_user, repo) for repo in DEPENDABOT_REPOS]
+    )
+    issues = [issue for repo_issues in per_repo_issues for issue in repo_issues]
     logger.info(f"Retrieved {len(issues)} Dependabot alerts assigned to user.")
     return models.GitHubIssueCollection(*issues)
 
 
-def github_get_all_items(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
+def github_get_dependabot_alerts(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
+    return run_sync(async_github_get_dependabot_alerts(current_user))
+
+
+GITHUB_GRAPHQL_SEARCHES = {
+    "assigned": "is:open assignee:@me",
+    "reviewRequests": "is:open is:pr draft:false review-requested:@me",
+    "created": "is:open is:pr draft:false author:@me",
+}
+
+GITHUB_GRAPHQL_ITEMS_QUERY = """
+fragment ItemFields on Node {
+  __typename
+  ... on Issue {
+    databaseId number title url state
+    repository { nameWithOwner }
+    author { login }
+    labels(first: 20) { nodes { name } }
+  }
+  ... on PullRequest {
+    databaseId number title url state isDraft
+    repository { nameWithOwner }
+    author { login }
+    labels(first: 20) { nodes { name } }
+  }
+}
+
+query(
+  $assignedQuery: String!, $assignedCursor: String, $withAssigned: Boolean!,
+  $reviewRequestsQuery: String!, $reviewRequestsCursor: String, $withReviewRequests: Boolean!,
+  $createdQuery: String!, $createdCursor: String, $withCreated: Boolean!
+) {
+  assigned: search(query: $assignedQuery, type: ISSUE, first: 100, after: $assignedCursor)
+    @include(if: $withAssigned) {
+    pageInfo { hasNextPage endCursor }
+    nodes { ...ItemFields }
+  }
+  reviewRequests: search(query: $reviewRequestsQuery, type: ISSUE, first: 100, after: $reviewRequestsCursor)
+    @include(if: $withReviewRequests) {
+    pageInfo { hasNextPage endCursor }
+    nodes { ...ItemFields }
+  }
+  created: search(query: $createdQuery, type: ISSUE, first: 100, after: $createdCursor)
+    @include(if: $withCreated) {
+    pageInfo { hasNextPage endCursor }
+    nodes { ...ItemFields }
+  }
+}
+"""
+
+
+async def async_github_graphql(query: str, variables: Dict) -> Dict:
+    response = await async_request(
+        github_session(),
+        "POST",
+        f"{GITHUB_API_BASE}/graphql",
+        json={"query": query, "variables": variables},
+    )
+    response_data = response_to_json_value(response)
+    if response_data.get("errors"):
+        raise ValueError(f"GitHub GraphQL query failed: {response_data['errors']}")
+    return response_data["data"]
+
+
+async def async_github_graphql_get_items(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
+    """
+    Get assigned issues/PRs, review requests and created PRs with a single GraphQL query per page.
+
+    All three searches share a request; once a search runs out of pages it is left out of the next one.
+    """
+    cursors: Dict[str, Optional[str]] = {alias: None for alias in GITHUB_GRAPHQL_SEARCHES}
+    pending = set(GITHUB_GRAPHQL_SEARCHES)
+    nodes = []
+
+    while pending:
+        variables = {}
+        for alias, search_query in GITHUB_GRAPHQL_SEARCHES.items():
+            variables[f"{alias}Query"] = search_query
+            variables[f"{alias}Cursor"] = cursors[alias]
+            variables[f"with{alias[0].upper()}{alias[1:]}"] = alias in pending
+
+        data = await async_github_graphql(GITHUB_GRAPHQL_ITEMS_QUERY, variables)
+        for alias in list(pending):
+            connection = data[alias]
+            nodes.extend(connection["nodes"])
+            if connection["pageInfo"]["hasNextPage"]:
+                cursors[alias] = connection["pageInfo"]["endCursor"]
+            else:
+                pending.remove(alias)
+
+    github_issue_collection = models.GitHubIssueCollection.from_graphql_nodes(nodes, current_user)
+    logger.info(f"Retrieved {len(github_issue_collection)} GitHub issues/PRs through GraphQL.")
+    return github_issue_collection
+
+
+async def async_github_get_all_items(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
     """Get all GitHub items: assigned issues/PRs, review requests, and created PRs."""
-    assigned = github_get_assigned_issues(current_user)
-    review_requests = github_get_review_requests(current_user)
-    created_prs = github_get_created_prs(current_user)
-    dependabot_alerts = github_get_dependabot_alerts(current_user)
+    if config.github.use_graphql:
+        # Dependabot alert assignees are only exposed through REST
+        graphql_items, dependabot_alerts = await asyncio.gather(
+            async_github_graphql_get_items(current_user),
+            async_github_get_dependabot_alerts(current_user),
+        )
+        return (graphql_items + dependabot_alerts).distinct()
+
+    assigned, review_requests, created_prs, dependabot_alerts = await asyncio.gather(
+        async_github_get_assigned_issues(current_user),
+        async_github_get_review_requests(current_user),
+        async_github_get_created_prs(current_user),
+        async_github_get_dependabot_alerts(current_user),
+    )
 
     # Combine and deduplicate using the distinct() method from Collection
     combined = assigned + review_requests + created_prs + dependabot_alerts
     return combined.distinct()
+
+
+def github_get_all_items(current_user: models.GitHubUser) -> models.GitHubIssueCollection:
+    return run_sync(async_github_get_all_items(current_user))
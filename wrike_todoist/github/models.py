@@ -23,6 +23,13 @@ class GitHubUser:
         )
 
 
+# Top-level fields of REST responses read by GitHubIssue, the conditional cache keeps only these
+ISSUE_RESPONSE_FIELDS = (
+    "id", "number", "title", "html_url", "state", "body", "labels", "repository_url", "pull_request", "draft", "user"
+)
+DEPENDABOT_ALERT_FIELDS = ("number", "html_url", "state", "security_advisory", "security_vulnerability", "assignees")
+
+
 @dataclasses.dataclass
 class GitHubIssue(Item):
     id: int
@@ -72,6 +79,22 @@ class GitHubIssue(Item):
             created_by_me=created_by_me,
         )
 
+    @classmethod
+    def from_graphql_node(cls, node: Dict, current_user: GitHubUser) -> GitHubIssue:
+        author = node.get("author") or {}
+        return cls(
+            id=node["databaseId"],
+            number=node["number"],
+            title=node["title"],
+            html_url=node["url"],
+            state=node["state"].lower(),
+            body=None,  # not needed to build tasks, so not requested
+            labels=[label["name"] for label in node["labels"]["nodes"]],
+            repository_name=node["repository"]["nameWithOwner"],
+            is_pull_request=node["__typename"] == "PullRequest",
+            draft=node.get("isDraft", False),
+            created_by_me=author.get("login") == current_user.login,
+        )
 
     @classmethod
     def from_dependabot_alert(cls, alert: Dict, repository_name: str) -> GitHubIssue:
@@ -97,3 +120,7 @@ class GitHubIssueCollection(Collection):
     @classmethod
     def from_response(cls, response: List[Dict], current_user: GitHubUser) -> GitHubIssueCollection:
         return cls(*[cls.type.from_response(item, current_user) for item in response])
+
+    @classmethod
+    def from_graphql_nodes(cls, nodes: List[Dict], current_user: GitHubUser) -> GitHubIssueCollection:
+        return cls(*[cls.type.from_graphql_node(node, current_user) for node in nodes if node])
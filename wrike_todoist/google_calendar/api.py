@@ -1,36 +1,92 @@
 import datetime
+import functools
 import logging
-from typing import Callable, Iterator
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 from google.oauth2.credentials import Credentials
 from googleapiclient import discovery
+from googleapiclient.errors import HttpError
 import pendulum
 
-from wrike_todoist import config
+from wrike_todoist import config, metrics
+from wrike_todoist.cache import get_cache
 from wrike_todoist.google_calendar import models
 from wrike_todoist.google_calendar.models import CalendarEventCollection
 
 
 logger = logging.getLogger(__name__)
 
+# Metric labels of the events.list calls, which go through the client's own HTTP transport
+GOOGLE_CALENDAR_UPSTREAM = "www.googleapis.com"
+GOOGLE_CALENDAR_EVENTS_PATH = "/calendar/v3/calendars/{calendar}/events"
 
-def requires_service(func) -> Callable:
+
+@functools.lru_cache(maxsize=None)
+def get_service() -> discovery.Resource:
+    """
+    Build the Calendar events service on first use and keep it for the life of the process.
+
+    The discovery document bundled with google-api-python-client is used, so building it needs no network;
+    the service keeps one authorized HTTP client that is reused by every call.
+    """
+    authorized_user_info = {
+        "refresh_token": config.google_calendar.refresh_token,
+        "client_id": config.google_calendar.gcp_client_id,
+        "client_secret": config.google_calendar.gcp_client_secret,
+    }
     credentials = Credentials.from_authorized_user_info(
-        {
-            "refresh_token": config.config.google_calendar_refresh_token,
-            "client_id": config.config.gcp_client_id,
-            "client_secret": config.config.gcp_client_secret,
-        },
+        authorized_user_info,
         scopes=["https://www.googleapis.com/auth/calendar.readonly"],
     )
-    service = discovery.build("calendar", "v3", credentials=credentials).events()
+    client_options = None
+    if config.config.api_endpoint:
+        credentials = credentials.with_token_uri(f"{config.config.api_endpoint}/token")
+        client_options = {"api_endpoint": f"{config.config.api_endpoint}/calendar/v3/"}
+    service = discovery.build(
+        "calendar",
+        "v3",
+        credentials=credentials,
+        static_discovery=True,
+        cache_discovery=False,
+        client_options=client_options,
+    )
+    logger.info("Built Google Calendar service.")
+    return service.events()
 
+
+def requires_service(func) -> Callable:
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        return func(service, *args, **kwargs)
+        return func(get_service(), *args, **kwargs)
 
     return wrapper
 
 
+def execute(request) -> dict:
+    """Execute an events.list request and record it in the request and page metrics."""
+    started = time.monotonic()
+    status = "error"
+    try:
+        response = request.execute()
+        status = 200
+        return response
+    except HttpError as e:
+        status = e.resp.status
+        raise
+    finally:
+        metrics.observe_request(
+            GOOGLE_CALENDAR_UPSTREAM,
+            GOOGLE_CALENDAR_EVENTS_PATH,
+            request.method,
+            status,
+            time.monotonic() - started,
+            None,
+        )
+        if status == 200:
+            metrics.observe_page(f"https://{GOOGLE_CALENDAR_UPSTREAM}{GOOGLE_CALENDAR_EVENTS_PATH}")
+
+
 def page_iterator(
     service: discovery.Resource,
     calendar_id: str,
@@ -45,13 +101,98 @@ def page_iterator(
         orderBy="startTime",
     )
     while request:
-        response = request.execute()
+        response = execute(request)
         items = response.get("items", [])
         for item in items:
             yield item
         request = service.list_next(request, response)
 
 
+def list_changed_events(
+    service: discovery.Resource,
+    calendar_id: str,
+    sync_token: Optional[str],
+    time_min: datetime.datetime,
+    time_max: datetime.datetime,
+) -> Tuple[List[dict], str]:
+    """
+    Return events changed since `sync_token` (including cancelled ones) and the next sync token.
+
+    Without a token this is the initial full sync of events between `time_min` and `time_max`; the API does
+    not accept time bounds or ordering together with a sync token, so those are only used for the initial request.
+    """
+    if sync_token:
+        request = service.list(calendarId=calendar_id, singleEvents=True, syncToken=sync_token)
+    else:
+        request = service.list(
+            calendarId=calendar_id,
+            singleEvents=True,
+            timeMin=time_min.isoformat(),
+            timeMax=time_max.isoformat(),
+        )
+
+    events = []
+    next_sync_token = None
+    while request:
+        response = execute(request)
+        events.extend(response.get("items", []))
+        next_sync_token = response.get("nextSyncToken", next_sync_token)
+        request = service.list_next(request, response)
+    return events, next_sync_token
+
+
+def in_window(event: dict, time_min: datetime.datetime, time_max: datetime.datetime) -> bool:
+    return (
+        models.TimeInfo.from_response(event["end"]).dateTime > time_min
+        and models.TimeInfo.from_response(event["start"]).dateTime < time_max
+    )
+
+
+def sync_events(
+    service: discovery.Resource,
+    calendar_id: str,
+    time_min: datetime.datetime,
+    time_max: datetime.datetime,
+) -> Dict[str, dict]:
+    """
+    Bring the persisted event cache of a calendar up to date and return it, keyed by event id.
+
+    The cache holds one window at a time: a window other than the cached one (e.g. on a new day) starts over
+    with a bounded full sync, so only changed events are ever parsed to check they fall within it.
+    A 410 Gone drops the sync token and re-syncs fully.
+    """
+    cache = get_cache("google_calendar_events")
+    state = cache.get(calendar_id)
+    window = [time_min.isoformat(), time_max.isoformat()]
+    if state is not None and state.get("window") != window:
+        state = None
+
+    try:
+        changed_events, next_sync_token = list_changed_events(
+            service, calendar_id, state and state["sync_token"], time_min, time_max
+        )
+    except HttpError as e:
+        if state is None or e.resp.status != 410:
+            raise
+        logger.warning("Calendar sync token expired, falling back to full sync.")
+        state = None
+        changed_events, next_sync_token = list_changed_events(service, calendar_id, None, time_min, time_max)
+
+    events = {} if state is None else dict(state["events"])
+    for event in changed_events:
+        if event.get("status") == "cancelled" or not in_window(event, time_min, time_max):
+            events.pop(event["id"], None)
+        else:
+            events[event["id"]] = event
+    logger.info(
+        f"Applied {len(changed_events)} calendar event changes "
+        f"({'full' if state is None else 'incremental'} sync)."
+    )
+
+    cache.set(calendar_id, {"window": window, "sync_token": next_sync_token, "events": events})
+    return events
+
+
 @requires_service
 def pull_todays_events(service: discovery.Resource) -> CalendarEventCollection:
     start_of_day = pendulum.today()
@@ -59,9 +200,12 @@ def pull_todays_events(service: discovery.Resource) -> CalendarEventCollection:
 
     events_hydrated = []
 
-    api_events = page_iterator(
-        service, config.config.google_calendar_id, start_of_day, end_of_day
-    )
+    if config.google_calendar.incremental_sync:
+        api_events = sync_events(service, config.google_calendar.calendar_id, start_of_day, end_of_day).values()
+    else:
+        api_events = page_iterator(
+            service, config.google_calendar.calendar_id, start_of_day, end_of_day
+        )
     for event_response in api_events:
         events_hydrated.append(models.CalendarEvent.from_response(event_response))
 
@@ -1,18 +1,35 @@
+import hashlib
+import json
+import logging
+import time
+
 import pendulum
 import requests
 
-from wrike_todoist.api_utils import response_to_json_value
+from wrike_todoist.api_utils import JSONValue, async_request, get_session, response_to_json_value, run_sync
+from wrike_todoist.cache import PersistentCache, get_cache
 from wrike_todoist.harmonogram import models
 from wrike_todoist.models import Collection
 
+logger = logging.getLogger(__name__)
+
 
 HOUSE_NUMBER = "188/E/1"
 TOWN_ID = 1119
 BASE_URL = "https://api.ecoharmonogram.pl/v1/plugin/v1"
+SNAPSHOT_MAX_AGE = 7 * 24 * 60 * 60  # the schedule changes about once a year, but corrections do happen
+SNAPSHOT_MIN_HORIZON_DAYS = 14  # refetch (and re-resolve the period) when the snapshot is about to run out
+SNAPSHOT_HORIZON_REFETCH_INTERVAL = 24 * 60 * 60  # the next period is published at some point before it starts
 
 
-def discover_schedule_period_id(street_name: str) -> int:
-    response = requests.post(f"{BASE_URL}/streetsForTown", data={"townId": TOWN_ID})
+def harmonogram_session() -> requests.Session:
+    return get_session(BASE_URL)
+
+
+async def async_discover_schedule_period_id(street_name: str) -> int:
+    response = await async_request(
+        harmonogram_session(), "POST", f"{BASE_URL}/streetsForTown", data={"townId": TOWN_ID}
+    )
     streets = response_to_json_value(response, "utf-8-sig")
     for street in streets:
         if street_name in street["name"]:
@@ -20,8 +37,12 @@ def discover_schedule_period_id(street_name: str) -> int:
     raise ValueError(f"No street matching '{street_name}' in town {TOWN_ID}")
 
 
-def find_street_id(street_name: str) -> int:
-    schedule_period_id = discover_schedule_period_id(street_name)
+def discover_schedule_period_id(street_name: str) -> int:
+    return run_sync(async_discover_schedule_period_id(street_name))
+
+
+async def async_find_street_id(street_name: str) -> int:
+    schedule_period_id = await async_discover_schedule_period_id(street_name)
     payload = {
         "groupId": 1,
         "number": HOUSE_NUMBER,
@@ -30,7 +51,9 @@ def find_street_id(street_name: str) -> int:
         "streetName": street_name,
         "townId": TOWN_ID,
     }
-    streets_response = requests.post(
+    streets_response = await async_request(
+        harmonogram_session(),
+        "POST",
         f"{BASE_URL}/streets",
         data=payload,
     )
@@ -50,8 +73,14 @@ def find_street_id(street_name: str) -> int:
     )
 
 
-def pull_future_collection_days(street_id: int) -> Collection:
-    schedules_response = requests.post(
+def find_street_id(street_name: str) -> int:
+    return run_sync(async_find_street_id(street_name))
+
+
+async def async_pull_schedules(street_id: int) -> JSONValue:
+    schedules_response = await async_request(
+        harmonogram_session(),
+        "POST",
         f"{BASE_URL}/schedules",
         data={
             "number": HOUSE_NUMBER,
@@ -59,11 +88,82 @@ def pull_future_collection_days(street_id: int) -> Collection:
             "streetId": street_id,
         },
     )
-    schedules_list = response_to_json_value(schedules_response, "utf-8-sig")
+    return response_to_json_value(schedules_response, "utf-8-sig")
+
+
+def _future_collection_days(collection_days: Collection) -> Collection:
+    return collection_days.filter(lambda c: c.date >= pendulum.today().date())
+
 
+async def async_pull_future_collection_days(street_id: int) -> Collection:
+    schedules_list = await async_pull_schedules(street_id)
     all_collections = models.CollectionDayCollection.from_response(schedules_list)
-    future_collections = all_collections.filter(
-        lambda c: c.date >= pendulum.today().date()
+    return _future_collection_days(all_collections)
+
+
+def pull_future_collection_days(street_id: int) -> Collection:
+    return run_sync(async_pull_future_collection_days(street_id))
+
+
+def harmonogram_cache() -> PersistentCache:
+    return get_cache("harmonogram")
+
+
+async def async_resolve_street_id(street_name: str, refresh: bool = False) -> int:
+    """Street id for the configured address, resolved through the API only when not cached yet."""
+    cache = harmonogram_cache()
+    cache_key = f"street:{TOWN_ID}:{street_name}:{HOUSE_NUMBER}"
+    street_id = None if refresh else cache.get(cache_key)
+    if street_id is None:
+        street_id = await async_find_street_id(street_name)
+        cache.set(cache_key, street_id)
+    return street_id
+
+
+def _is_snapshot_fresh(snapshot: dict, collection_days: Collection) -> bool:
+    age = time.time() - snapshot["fetched_at"]
+    if age > SNAPSHOT_MAX_AGE:
+        return False
+    horizon = pendulum.today().date().add(days=SNAPSHOT_MIN_HORIZON_DAYS)
+    return age <= SNAPSHOT_HORIZON_REFETCH_INTERVAL or any(
+        collection_day.date >= horizon for collection_day in collection_days
+    )
+
+
+async def async_get_future_collection_days(street_name: str) -> Collection:
+    """
+    Future collection days for the configured address, generated from the local schedule snapshot.
+
+    The snapshot is refetched when it is older than SNAPSHOT_MAX_AGE, or once per
+    SNAPSHOT_HORIZON_REFETCH_INTERVAL while it no longer reaches SNAPSHOT_MIN_HORIZON_DAYS ahead. When it ran
+    out entirely the schedule period has rolled over, so the street is resolved again as well. A refetch
+    with unchanged content only refreshes the snapshot timestamp.
+    """
+    cache = harmonogram_cache()
+    street_id = await async_resolve_street_id(street_name)
+    snapshot = cache.get(f"schedule:{street_id}")
+
+    if snapshot is not None:
+        collection_days = models.CollectionDayCollection.from_response(snapshot["schedules"])
+        if _is_snapshot_fresh(snapshot, collection_days):
+            logger.info(f"Using harmonogram snapshot {snapshot['sha256'][:12]}.")
+            return _future_collection_days(collection_days)
+        if not any(collection_day.date >= pendulum.today().date() for collection_day in collection_days):
+            logger.info("Harmonogram snapshot ran out, resolving the schedule period again.")
+            street_id = await async_resolve_street_id(street_name, refresh=True)
+
+    schedules = await async_pull_schedules(street_id)
+    content_hash = hashlib.sha256(json.dumps(schedules, sort_keys=True).encode("utf-8")).hexdigest()
+    if snapshot is not None and snapshot["sha256"] == content_hash:
+        logger.info(f"Harmonogram schedule unchanged since snapshot {content_hash[:12]}, refreshing it.")
+    else:
+        collection_days = models.CollectionDayCollection.from_response(schedules)
+    cache.set(
+        f"schedule:{street_id}",
+        {"fetched_at": time.time(), "sha256": content_hash, "schedules": schedules},
     )
+    return _future_collection_days(collection_days)
+
 
-    return future_collections
+def get_future_collection_days(street_name: str) -> Collection:
+    return run_sync(async_get_future_collection_days(street_name))
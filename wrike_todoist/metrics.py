@@ -0,0 +1,269 @@
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in values]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (the last one is +Inf), sum
+        self._values: Dict[LabelValues, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for upper_bound, count in zip([*self.buckets, float("inf")], counts):
+                cumulative += count
+                le = "+Inf" if upper_bound == float("inf") else _format_value(upper_bound)
+                labels = _format_labels((*self.labelnames, "le"), (*key, le))
+                samples.append((f"{self.name}_bucket", labels, cumulative))
+            labels = _format_labels(self.labelnames, key)
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(
+    Counter(
+        "wrike_todoist_http_requests_total",
+        "HTTP requests sent, by upstream, endpoint and status code.",
+        ("upstream", "endpoint", "method", "status"),
+    )
+)
+http_request_duration = registry.register(
+    Histogram(
+        "wrike_todoist_http_request_duration_seconds",
+        "Duration of HTTP requests including retries.",
+        ("upstream", "endpoint"),
+    )
+)
+http_response_bytes = registry.register(
+    Counter("wrike_todoist_http_response_bytes_total", "Bytes of HTTP response bodies.", ("upstream", "endpoint"))
+)
+http_retries = registry.register(
+    Counter("wrike_todoist_http_retries_total", "Retries done by the HTTP client.", ("upstream", "endpoint"))
+)
+pages = registry.register(
+    Counter("wrike_todoist_pages_total", "Pages read from paginated endpoints.", ("upstream", "endpoint"))
+)
+rate_limit_remaining = registry.register(
+    Gauge("wrike_todoist_rate_limit_remaining", "Requests left in the rate limit of an upstream.", ("limit",))
+)
+mutations = registry.register(
+    Counter(
+        "wrike_todoist_mutations_total",
+        "Todoist mutations computed (planned) and acknowledged (applied) per pipeline.",
+        ("pipeline", "action", "outcome"),
+    )
+)
+pipeline_runs = registry.register(
+    Counter("wrike_todoist_pipeline_runs_total", "Pipeline runs by result.", ("pipeline", "status"))
+)
+pipeline_duration = registry.register(
+    Histogram(
+        "wrike_todoist_pipeline_duration_seconds",
+        "Wall time of pipeline runs.",
+        ("pipeline",),
+        buckets=(1, 5, 10, 30, 60, 120, 300, 600),
+    )
+)
+pipeline_last_success = registry.register(
+    Gauge("wrike_todoist_pipeline_last_success_timestamp_seconds", "Time of the last successful run.", ("pipeline",))
+)
+
+
+RE_ID_SEGMENT = re.compile(r"^(?!v\d+$)(?=.*\d)[\w.-]+$")  # any segment with a digit, except API versions
+
+
+def endpoint_label(path: str) -> str:
+    """Path with ids and repository names replaced, so the endpoint label has a bounded set of values."""
+    segments = path.strip("/").split("/")
+    if len(segments) >= 3 and segments[0] == "repos":
+        segments[1:3] = ["{repo}"]
+    return "/" + "/".join("{id}" if RE_ID_SEGMENT.match(segment) else segment for segment in segments)
+
+
+def observe_request(
+    upstream: str,
+    path: str,
+    method: str,
+    status: Union[int, str],
+    duration: float,
+    response_bytes: Optional[int],
+    retries: int = 0,
+):
+    """Record one HTTP request; `response_bytes` is None when the client does not expose the body size."""
+    endpoint = endpoint_label(path)
+    http_requests.inc(upstream=upstream, endpoint=endpoint, method=method, status=str(status))
+    http_request_duration.observe(duration, upstream=upstream, endpoint=endpoint)
+    if response_bytes is not None:
+        http_response_bytes.inc(response_bytes, upstream=upstream, endpoint=endpoint)
+    if retries:
+        http_retries.inc(retries, upstream=upstream, endpoint=endpoint)
+
+
+def observe_page(url: str):
+    parts = urlsplit(url)
+    pages.inc(upstream=parts.netloc, endpoint=endpoint_label(parts.path))
+
+
+def observe_mutations(pipeline: str, outcome: str, counts: Dict[str, int]):
+    """Count mutations per action, e.g. the reconciliations of a plan or TaskComparisonResult.counts()."""
+    for action, count in counts.items():
+        mutations.inc(count, pipeline=pipeline, action=action, outcome=outcome)
+
+
+def observe_pipeline_run(pipeline: str, duration: float, failed: bool):
+    pipeline_runs.inc(pipeline=pipeline, status="failed" if failed else "succeeded")
+    pipeline_duration.observe(duration, pipeline=pipeline)
+    if not failed:
+        pipeline_last_success.set(time.time(), pipeline=pipeline)
+
+
+_textfile_lock = threading.Lock()
+
+
+def write_textfile(path: str):
+    """Write the metrics for the node_exporter textfile collector, atomically."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    # Pipelines finishing together in daemon mode would otherwise share the temporary file
+    with _textfile_lock:
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(registry.render())
+        os.replace(temporary_path, path)
+
+
+def serve(port: int, host: str = ""):
+    """Serve /metrics from a background thread until the process exits, returns the server."""
+    # Imported here, http.server would add noticeably to the import time of the CLI
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving metrics on port {server.server_address[1]}.")
+    return server
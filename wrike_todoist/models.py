@@ -3,7 +3,7 @@ from __future__ import annotations
 import dataclasses
 import enum
 import logging
-from typing import Dict, List, Type, Optional, TypeVar, Any, Callable, Iterator
+from typing import Dict, List, Type, Optional, TypeVar, Any, Callable, Iterable, Iterator, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -58,10 +58,19 @@ CollectionType = TypeVar("CollectionType", bound=Item)
 
 
 class Collection:
-    primary_key_field_name: str
+    """
+    Ordered collection of items, indexed by primary key and optional secondary fields.
+
+    Indexes are keyed on the value read with getattr, so computed properties work as well,
+    but an indexed value mutated in place is only picked up after reindex().
+    """
+
+    primary_key_field_name: Optional[str] = None
+    index_field_names: Tuple[str, ...] = ()
     type: Type[CollectionType]
 
     _members: List[CollectionType]
+    _indexes: Dict[str, Dict[Any, List[CollectionType]]]
 
     def __init__(self, *members: CollectionType):
         for member in members:
@@ -69,7 +78,27 @@ class Collection:
                 raise ValueError(
                     f"Invalid member {member}. Required type is {self.type}."
                 )
-        self._members = list(members)
+        self._members = []
+        self._indexes = {field_name: {} for field_name in self.indexed_field_names()}
+        self._extend(members)
+
+    @classmethod
+    def indexed_field_names(cls) -> Tuple[str, ...]:
+        if cls.primary_key_field_name is None:
+            return cls.index_field_names
+        return (cls.primary_key_field_name, *cls.index_field_names)
+
+    def _extend(self, members: Iterable[CollectionType]):
+        for member in members:
+            self._members.append(member)
+            for field_name, index in self._indexes.items():
+                index.setdefault(getattr(member, field_name), []).append(member)
+
+    def reindex(self):
+        members = self._members
+        self._members = []
+        self._indexes = {field_name: {} for field_name in self._indexes}
+        self._extend(members)
 
     def __iter__(self):
         return iter(self._members)
@@ -82,14 +111,15 @@ class Collection:
 
     def __contains__(self, item):
         try:
-            sub_collection = self.filter(
-                **{
-                    self.primary_key_field_name: getattr(
-                        item, self.primary_key_field_name
-                    )
-                }
+            return bool(
+                self._filter_members(
+                    **{
+                        self.primary_key_field_name: getattr(
+                            item, self.primary_key_field_name
+                        )
+                    }
+                )
             )
-            return bool(sub_collection)
         except ValueError:
             return False
 
@@ -98,38 +128,47 @@ class Collection:
 
     def __add__(self, other: CollectionType):
         if isinstance(other, Collection):
-            self._members += other._members
+            self._extend(list(other._members))
         else:
-            self._members.append(other)
+            self._extend([other])
         return self
 
-    def filter(
+    def _filter_members(
         self, fn: Optional[Callable[[Item], bool]] = None, **fields: Any
-    ) -> Collection:
+    ) -> List[CollectionType]:
         if fn and fields:
             raise ValueError("Use either fn or **fields.")
 
-        collection_type = type(self)
-        members = []
-
-        for item in self:
-            if fn:
-                if fn(item):
-                    members.append(item)
-                continue
-
-            for field_name, field_value in fields.items():
-                if getattr(item, field_name) != field_value:
-                    break
-            else:
-                members.append(item)
+        if fn:
+            return [item for item in self if fn(item)]
+
+        candidates = self._members
+        for field_name, field_value in fields.items():
+            if field_name in self._indexes:
+                try:
+                    candidates = self._indexes[field_name].get(field_value, [])
+                except TypeError:  # unhashable lookup value, scan instead
+                    continue
+                break
+
+        return [
+            item
+            for item in candidates
+            if all(
+                getattr(item, field_name) == field_value
+                for field_name, field_value in fields.items()
+            )
+        ]
 
-        return collection_type(*members)
+    def filter(
+        self, fn: Optional[Callable[[Item], bool]] = None, **fields: Any
+    ) -> Collection:
+        return type(self)(*self._filter_members(fn, **fields))
 
     def get(
         self, fn: Optional[Callable[[Item], bool]] = None, **fields: Any
     ) -> CollectionType:
-        filtered = self.filter(fn, **fields)
+        filtered = self._filter_members(fn, **fields)
         if not filtered:
             raise ValueError(f"No objects found - {fn=} {fields=}.")
         if len(filtered) > 1:
@@ -137,9 +176,6 @@ class Collection:
         return filtered[0]
 
     def distinct(self) -> Collection:
-        distinct_collections = {}
-
-        for item in self:
-            distinct_collections[getattr(item, self.primary_key_field_name)] = item
-
-        return type(self)(*distinct_collections.values())
+        # Keeps the last member per key, in order of first appearance
+        pk_index = self._indexes[self.primary_key_field_name]
+        return type(self)(*[members[-1] for members in pk_index.values()])
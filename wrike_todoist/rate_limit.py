@@ -0,0 +1,131 @@
+import email.utils
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from wrike_todoist import tracing
+
+logger = logging.getLogger(__name__)
+
+
+# (host, path prefix) -> (requests, period in seconds); the longest matching prefix wins
+RATE_LIMITS: Dict[Tuple[str, str], Tuple[int, float]] = {
+    ("api.todoist.com", "/"): (1000, 15 * 60),
+    ("api.github.com", "/"): (5000, 60 * 60),
+    ("api.github.com", "/search/"): (30, 60),
+    ("api.github.com", "/graphql"): (5000, 60 * 60),
+}
+
+
+def _parse_retry_after(value: str) -> Optional[float]:
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitGovernor:
+    """
+    Token bucket for one upstream rate limit, shared by every thread and event loop in the process.
+
+    The bucket is corrected by the `X-RateLimit-*` and `Retry-After` headers of each response, so
+    concurrently running pipelines slow down together instead of running into the limit.
+    """
+
+    def __init__(self, name: str, capacity: int, period: float):
+        self.name = name
+        self.capacity = capacity
+        self.period = period
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.capacity / self.period)
+        self._updated_at = now
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before the request may be sent."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = max(0.0, self._blocked_until - now)
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens * self.period / self.capacity)
+            return wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            logger.info(f"Rate limit {self.name}: waiting {wait:.1f}s.")
+            with tracing.span("rate_limit.wait", self.name, seconds=wait):
+                time.sleep(wait)
+
+    def update(self, response: requests.Response):
+        headers = response.headers
+        retry_after = _parse_retry_after(headers["Retry-After"]) if "Retry-After" in headers else None
+        try:
+            limit = int(headers["X-RateLimit-Limit"]) if "X-RateLimit-Limit" in headers else None
+            remaining = int(headers["X-RateLimit-Remaining"]) if "X-RateLimit-Remaining" in headers else None
+            reset_at = float(headers["X-RateLimit-Reset"]) if "X-RateLimit-Reset" in headers else None
+        except ValueError:
+            logger.warning(f"Rate limit {self.name}: unparsable rate limit headers {dict(headers)}.")
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit:
+                self.capacity = limit
+            if remaining is not None:
+                self._tokens = min(self._tokens, remaining)
+                if remaining == 0 and reset_at is not None:
+                    self._blocked_until = max(self._blocked_until, now + max(0.0, reset_at - time.time()))
+            if retry_after is not None and response.status_code in (403, 429, 503):
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+
+        if response.status_code in (403, 429) and (retry_after is not None or remaining == 0):
+            logger.warning(f"Rate limit {self.name} hit, pausing all calls to it.")
+
+    def remaining(self) -> int:
+        """Requests that can be sent right now without waiting."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._blocked_until > now:
+                return 0
+            return max(0, int(self._tokens))
+
+
+_governors: Dict[Tuple[str, str], RateLimitGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(url: str) -> Optional[RateLimitGovernor]:
+    """Return the governor of the rate limit that applies to `url`, or None for unlimited upstreams."""
+    parts = urlsplit(url)
+    matching = [key for key in RATE_LIMITS if key[0] == parts.netloc and parts.path.startswith(key[1])]
+    if not matching:
+        return None
+    key = max(matching, key=lambda key: len(key[1]))
+    with _governors_lock:
+        if key not in _governors:
+            capacity, period = RATE_LIMITS[key]
+            _governors[key] = RateLimitGovernor(f"{key[0]}{key[1]}", capacity, period)
+        return _governors[key]
+
+
+def remaining_budget(url: str) -> Optional[int]:
+    """Requests to `url` that can be sent right now, None when the upstream is not rate limited."""
+    governor = get_governor(url)
+    return governor.remaining() if governor is not None else None
@@ -1,42 +1,105 @@
+import asyncio
 import datetime
 import http
+import itertools
+import json
 import logging
+import threading
+import time
 import uuid
-from typing import Dict, Iterator, Optional
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import requests
 
-from wrike_todoist import models, config
-from wrike_todoist.api_utils import response_to_json_value
-from wrike_todoist.todoist import models
+from wrike_todoist import models, config, metrics, rate_limit, tracing
+from wrike_todoist.api_utils import async_request, get_session, response_to_json_value, run_sync
+from wrike_todoist.cache import PersistentCache, get_cache
+from wrike_todoist.todoist import models, plan
 
 logger = logging.getLogger(__name__)
 
 TODOIST_API_BASE = "https://api.todoist.com/api/v1"
+TODOIST_SYNC_BATCH_SIZE = 100  # Sync API limit of commands per request
+TODOIST_COMPLETED_PAGE_SIZE = 200  # Maximum page size of the completed tasks endpoint
+TODOIST_HYDRATION_CONCURRENCY = 4
+TODOIST_SYNC_ATTEMPTS = 3
+TODOIST_SYNC_RETRY_BACKOFF = 1.0  # seconds, doubled after every failed attempt
+TODOIST_DIRECTORY_TTL = 24 * 60 * 60  # projects and labels are renamed rarely
+TODOIST_REPLICA_LOCK_POLL = 0.05  # seconds between attempts to take over the Sync API replica
+
+
+def todoist_session() -> requests.Session:
+    return get_session(
+        TODOIST_API_BASE,
+        headers={"Authorization": f"Bearer {config.todoist.access_token}"},
+    )
+
+
+def todoist_command_session() -> requests.Session:
+    """Session for Sync API commands, their uuids let Todoist drop a POST that is retried after a 5xx or 429."""
+    return get_session(
+        TODOIST_API_BASE,
+        headers={"Authorization": f"Bearer {config.todoist.access_token}"},
+        retry_posts=True,
+    )
 
 
-def todoist_paginate(url: str, params: Optional[Dict] = None) -> Iterator[Dict]:
+async def _async_todoist_get_page(url: str, params: Optional[Dict], cursor: Optional[str]) -> Dict:
+    page_params = dict(params or {})
+    if cursor:
+        page_params["cursor"] = cursor
+    response = await async_request(todoist_session(), "GET", url, params=page_params)
+    metrics.observe_page(url)
+    return response_to_json_value(response)
+
+
+async def async_todoist_paginate(
+    url: str, params: Optional[Dict] = None, results_key: str = "results"
+) -> AsyncIterator[Dict]:
     cursor = None
     while True:
-        page_params = dict(params or {})
-        if cursor:
-            page_params["cursor"] = cursor
-        response = requests.get(
-            url,
-            params=page_params,
-            headers={"Authorization": f"Bearer {config.config.todoist_access_token}"},
-        )
-        data = response_to_json_value(response)
-        yield from data["results"]
+        data = await _async_todoist_get_page(url, params, cursor)
+        for item in data.get(results_key, []):
+            yield item
         cursor = data.get("next_cursor")
         if not cursor:
             break
 
 
+def todoist_paginate(url: str, params: Optional[Dict] = None, results_key: str = "results") -> Iterator[Dict]:
+    # One page per run_sync call, so a sync caller streams pages instead of waiting for all of them
+    cursor = None
+    while True:
+        data = run_sync(_async_todoist_get_page(url, params, cursor))
+        yield from data.get(results_key, [])
+        cursor = data.get("next_cursor")
+        if not cursor:
+            break
+
+
+def todoist_directory_cache() -> PersistentCache:
+    return get_cache("todoist_directory", ttl=TODOIST_DIRECTORY_TTL)
+
+
+def _todoist_directory(name: str, refresh: bool = False) -> List[Dict]:
+    cache = todoist_directory_cache()
+    entries = None if refresh else cache.get(name)
+    if entries is None:
+        entries = [
+            {"id": entry["id"], "name": entry["name"]}
+            for entry in todoist_paginate(f"{TODOIST_API_BASE}/{name}")
+        ]
+        cache.set(name, entries)
+    else:
+        logger.info(f"Using cached Todoist {name}.")
+    return entries
+
+
 def todoist_get_project_by_name(name: str) -> models.TodoistProject:
-    todoist_projects = models.TodoistProjectCollection.from_response(
-        todoist_paginate(f"{TODOIST_API_BASE}/projects")
-    )
+    todoist_projects = models.TodoistProjectCollection.from_response(_todoist_directory("projects"))
+    if not todoist_projects.filter(name=name):
+        logger.info(f"{name} is not a cached Todoist Project, refreshing.")
+        todoist_projects = models.TodoistProjectCollection.from_response(_todoist_directory("projects", refresh=True))
     logger.info(f"Retrieved {len(todoist_projects)} Todoist Projects.")
     todoist_project = todoist_projects.get(name=name)
     logger.info(f"{name} is a valid Todoist Project.")
@@ -44,174 +107,540 @@ def todoist_get_project_by_name(name: str) -> models.TodoistProject:
 
 
 def todoist_get_or_create_label(name: str) -> models.TodoistLabel:
-    todoist_labels = models.TodoistLabelCollection.from_response(
-        todoist_paginate(f"{TODOIST_API_BASE}/labels")
-    )
+    todoist_labels = models.TodoistLabelCollection.from_response(_todoist_directory("labels"))
+    if not todoist_labels.filter(name=name):
+        logger.info(f"{name} is not a cached Todoist Label, refreshing.")
+        todoist_labels = models.TodoistLabelCollection.from_response(_todoist_directory("labels", refresh=True))
     logger.info(f"Retrieved {len(todoist_labels)} Todoist Labels.")
 
     try:
-        todoist_label = todoist_labels[name]
+        todoist_label = todoist_labels.get(name=name)
         logger.info(f"{name} is an existing Todoist Label.")
         return todoist_label
 
-    except KeyError:
+    except ValueError:
         logger.info(f"{name} is not an existing Todoist Label, need to create.")
         todoist_label = models.TodoistLabel(id=models.PendingValue(), name=name)
 
-        todoist_label_response = requests.post(
+        todoist_label_response = todoist_session().post(
             f"{TODOIST_API_BASE}/labels",
-            headers={"Authorization": f"Bearer {config.config.todoist_access_token}"},
             json=todoist_label.serialize(),
+            # Same label, same request id, so a retried create is deduplicated by Todoist
+            headers={
+                "X-Request-Id": uuid.uuid5(models.IDEMPOTENCY_NAMESPACE, f"label|{name}").hex
+            },
         )
         todoist_label = models.TodoistLabel.from_response(
             response_to_json_value(todoist_label_response)
         )
+        todoist_directory_cache().invalidate("labels")
         logger.info(f"Successfully created Todoist Label {todoist_label.name}")
         return todoist_label
 
 
+async def _async_todoist_read_sync(sync_token: str) -> Dict:
+    sync_response = await async_request(
+        todoist_session(),
+        "POST",
+        f"{TODOIST_API_BASE}/sync",
+        data={"sync_token": sync_token, "resource_types": json.dumps(["items", "projects"])},
+    )
+    return response_to_json_value(sync_response)
+
+
+def _apply_sync_changes(replica: Dict[str, Dict], changes: List[Dict], full_sync: bool) -> Dict[str, Dict]:
+    resources = {} if full_sync else dict(replica)
+    for resource in changes:
+        if resource.get("is_deleted"):
+            resources.pop(resource["id"], None)
+        else:
+            resources[resource["id"]] = resource
+    return resources
+
+
+# Pipelines running in parallel share the replica, each update reads and rewrites all of it
+_replica_lock = threading.Lock()
+
+
+async def async_todoist_sync_replica() -> Dict:
+    """
+    Bring the local replica of Todoist items and projects up to date and return it.
+
+    Only the changes since the persisted sync_token are requested; a rejected token falls back to a full sync.
+    Items and projects are keyed by id, projects only keep their name.
+    """
+    # Polled, so waiting leaves the event loop free for the pipeline's other requests
+    while not _replica_lock.acquire(blocking=False):
+        await asyncio.sleep(TODOIST_REPLICA_LOCK_POLL)
+    try:
+        cache = get_cache("todoist_items")
+        replica = cache.get("replica")
+        if replica is None or "projects" not in replica:
+            replica = {"sync_token": "*", "items": {}, "projects": {}}
+
+        try:
+            sync_data = await _async_todoist_read_sync(replica["sync_token"])
+        except requests.HTTPError as e:
+            if (
+                replica["sync_token"] == "*"
+                or e.response is None
+                or e.response.status_code != http.HTTPStatus.BAD_REQUEST
+            ):
+                raise
+            logger.warning("Todoist rejected the sync token, falling back to full sync.")
+            sync_data = await _async_todoist_read_sync("*")
+
+        full_sync = sync_data.get("full_sync", True)
+        replica = {
+            "sync_token": sync_data["sync_token"],
+            "items": _apply_sync_changes(replica["items"], sync_data.get("items", []), full_sync),
+            "projects": _apply_sync_changes(
+                replica["projects"],
+                [
+                    {"id": project["id"], "name": project["name"]}
+                    if not project.get("is_deleted") and not project.get("is_archived")
+                    else {"id": project["id"], "is_deleted": True}
+                    for project in sync_data.get("projects", [])
+                ],
+                full_sync,
+            ),
+        }
+        logger.info(
+            f"Applied {len(sync_data.get('items', []))} Todoist item changes "
+            f"({'full' if full_sync else 'incremental'} sync)."
+        )
+        cache.set("replica", replica)
+        return replica
+    finally:
+        _replica_lock.release()
+
+
+def todoist_sync_replica() -> Dict:
+    return run_sync(async_todoist_sync_replica())
+
+
+def todoist_iter_tasks(
+    todoist_project: models.TodoistProject, only_due_today: bool = False
+) -> Iterator[models.TodoistTask]:
+    """Active tasks of a project, yielded as they are read instead of being collected first."""
+    if config.todoist.incremental_sync:
+        replica = todoist_sync_replica()
+        if todoist_project.id not in replica["projects"]:
+            # The project id most likely came from a stale directory cache, none of its tasks would match
+            todoist_directory_cache().invalidate("projects")
+            raise ValueError(f"Todoist Project {todoist_project.name} ({todoist_project.id}) no longer exists.")
+        yield from models.TodoistTaskCollection.iter_sync_replica(replica["items"], todoist_project.id)
+        return
+
+    try:
+        for item in todoist_paginate(f"{TODOIST_API_BASE}/tasks", params={"project_id": todoist_project.id}):
+            yield models.TodoistTask.from_response(item)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == http.HTTPStatus.NOT_FOUND:
+            # The project id most likely came from a stale directory cache
+            todoist_directory_cache().invalidate("projects")
+        raise
+
+
 def todoist_get_tasks(
     todoist_project: models.TodoistProject, only_due_today: bool = False
 ) -> models.TodoistTaskCollection:
-    todoist_task_collection = models.TodoistTaskCollection.from_response(
-        todoist_paginate(f"{TODOIST_API_BASE}/tasks", params={"project_id": todoist_project.id})
-    )
+    todoist_task_collection = models.TodoistTaskCollection(*todoist_iter_tasks(todoist_project, only_due_today))
     logger.info(f"Retrieved {len(todoist_task_collection)} Todoist Tasks.")
     return todoist_task_collection
 
 
-def todoist_get_completed_task(task_id: str) -> models.TodoistTask:
-    todoist_task_response = requests.get(
-        f"{TODOIST_API_BASE}/tasks/{task_id}",
-        headers={"Authorization": f"Bearer {config.config.todoist_access_token}"},
+async def async_todoist_get_completed_task(task_id: str) -> models.TodoistTask:
+    todoist_task_response = await async_request(
+        todoist_session(), "GET", f"{TODOIST_API_BASE}/tasks/{task_id}"
     )
     return models.TodoistTask.from_response(response_to_json_value(todoist_task_response))
 
 
-def todoist_get_completed_tasks(
+def todoist_get_completed_task(task_id: str) -> models.TodoistTask:
+    return run_sync(async_todoist_get_completed_task(task_id))
+
+
+async def async_todoist_get_completed_tasks(
     todoist_project: models.TodoistProject, since: datetime.datetime
 ) -> models.TodoistTaskCollection:
-    todoist_tasks_response = requests.get(
+    todoist_tasks = []
+    to_hydrate = []
+
+    async for completed_task_data in async_todoist_paginate(
         f"{TODOIST_API_BASE}/tasks/completed",
         params={
             "project_id": todoist_project.id,
             "since": since.isoformat(),
+            "limit": TODOIST_COMPLETED_PAGE_SIZE,
         },
-        headers={"Authorization": f"Bearer {config.config.todoist_access_token}"},
-    )
-
-    todoist_tasks = []
-    for rudimentary_task_data in response_to_json_value(todoist_tasks_response).get(
-        "items", []
+        results_key="items",
     ):
-        todoist_task = todoist_get_completed_task(rudimentary_task_data["task_id"])
-        todoist_tasks.append(todoist_task)
+        if models.TodoistTask.is_hydrated_completed_response(completed_task_data):
+            todoist_tasks.append(models.TodoistTask.from_completed_response(completed_task_data))
+        else:
+            to_hydrate.append(completed_task_data.get("task_id") or completed_task_data["id"])
+
+    if to_hydrate:
+        # Only payloads that lack the task fields need a per-task GET; run them in parallel, but bounded
+        logger.info(f"Hydrating {len(to_hydrate)} completed Todoist Tasks.")
+        hydration_semaphore = asyncio.Semaphore(TODOIST_HYDRATION_CONCURRENCY)
+
+        async def hydrate(task_id: str) -> models.TodoistTask:
+            async with hydration_semaphore:
+                return await async_todoist_get_completed_task(task_id)
+
+        todoist_tasks.extend(await asyncio.gather(*[hydrate(task_id) for task_id in to_hydrate]))
 
+    logger.info(f"Retrieved {len(todoist_tasks)} completed Todoist Tasks.")
     return models.TodoistTaskCollection(*todoist_tasks)
 
 
-def todoist_create_tasks(
-    todoist_tasks: models.TodoistTaskCollection,
+def todoist_get_completed_tasks(
+    todoist_project: models.TodoistProject, since: datetime.datetime
+) -> models.TodoistTaskCollection:
+    return run_sync(async_todoist_get_completed_tasks(todoist_project, since))
+
+
+async def _async_todoist_post_commands(batch: List[models.TodoistSyncCommand]) -> requests.Response:
+    """
+    Post a batch of commands, resending it when the connection breaks before Todoist answered.
+
+    Command uuids are deterministic, so commands that did reach Todoist the first time are not applied twice.
+    """
+    commands = json.dumps([command.serialize() for command in batch])
+    for attempt in range(1, TODOIST_SYNC_ATTEMPTS + 1):
+        try:
+            return await async_request(
+                todoist_command_session(), "POST", f"{TODOIST_API_BASE}/sync", data={"commands": commands}
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == TODOIST_SYNC_ATTEMPTS:
+                raise
+            logger.warning(f"Sending {len(batch)} Todoist commands failed ({e}), retrying.")
+            await asyncio.sleep(TODOIST_SYNC_RETRY_BACKOFF * 2 ** (attempt - 1))
+
+
+async def _async_todoist_sync_batch(
+    batch: List[models.TodoistSyncCommand],
+) -> List[models.TodoistSyncCommand]:
+    sync_response = await _async_todoist_post_commands(batch)
+    sync_data = response_to_json_value(sync_response)
+    sync_status = sync_data.get("sync_status", {})
+    temp_id_mapping = sync_data.get("temp_id_mapping", {})
+    logger.info(f"Sent batch of {len(batch)} Todoist commands.")
+
+    succeeded = []
+    for command in batch:
+        status = sync_status.get(command.uuid)
+        if status != "ok":
+            logger.error(
+                f"Todoist rejected {command.type.value} for {command.task.content}: {status}"
+            )
+            continue
+        if command.temp_id is not None:
+            command.task.id = temp_id_mapping.get(command.temp_id, command.task.id)
+        succeeded.append(command)
+    return succeeded
+
+
+async def async_todoist_sync_commands(
+    commands: List[models.TodoistSyncCommand],
+    journal: Optional[plan.PlanJournal] = None,
+) -> List[models.TodoistSyncCommand]:
+    """
+    Send commands through the Sync API in batches and return the ones Todoist acknowledged.
+
+    Batches are sent concurrently, so commands that depend on each other must go in separate calls.
+    Each answered batch is recorded in the journal, when one is given.
+    """
+
+    async def send(batch: List[models.TodoistSyncCommand]) -> List[models.TodoistSyncCommand]:
+        with tracing.span("todoist.batch", "Todoist Sync API commands", commands=len(batch)) as span:
+            succeeded = await _async_todoist_sync_batch(batch)
+            span.set_data("acknowledged", len(succeeded))
+        if journal is not None:
+            journal.record(batch, succeeded)
+        return succeeded
+
+    batches = [
+        commands[offset : offset + TODOIST_SYNC_BATCH_SIZE]
+        for offset in range(0, len(commands), TODOIST_SYNC_BATCH_SIZE)
+    ]
+    results = await asyncio.gather(*[send(batch) for batch in batches])
+    return [command for batch_succeeded in results for command in batch_succeeded]
+
+
+def todoist_sync_commands(
+    commands: List[models.TodoistSyncCommand],
+) -> List[models.TodoistSyncCommand]:
+    return run_sync(async_todoist_sync_commands(commands))
+
+
+COMMAND_LOG_MESSAGES = {
+    models.TodoistSyncCommandType.ITEM_ADD: "Created new Todoist Task {task.content}",
+    models.TodoistSyncCommandType.ITEM_UPDATE: "Updated Todoist Task {task.content}",
+    models.TodoistSyncCommandType.ITEM_CLOSE: "Closed Todoist Task {task.description}.",
+    models.TodoistSyncCommandType.ITEM_DELETE: "Removed Todoist Task {task.description}.",
+    models.TodoistSyncCommandType.ITEM_UNCOMPLETE: "Reopened Todoist Task {task.description}.",
+}
+
+
+def _commands_to_collection(
+    commands: List[models.TodoistSyncCommand],
+    *command_types: models.TodoistSyncCommandType,
 ) -> models.TodoistTaskCollection:
-    created = {}
+    tasks = {}
+    for command in commands:
+        if command.type in command_types:
+            tasks[command.task.permalink] = command.task
+            logger.info(COMMAND_LOG_MESSAGES[command.type].format(task=command.task))
+    return models.TodoistTaskCollection(*tasks.values())
+
 
+def _update_commands(
+    todoist_tasks: models.TodoistTaskCollection,
+) -> List[models.TodoistSyncCommand]:
+    commands = []
     for todoist_task in todoist_tasks:
-        create_task_response = requests.post(
-            f"{TODOIST_API_BASE}/tasks",
-            headers={
-                "Authorization": f"Bearer {config.config.todoist_access_token}",
-                "X-Request-Id": uuid.uuid4().hex,
-            },
-            json=todoist_task.serialize(),
+        command = models.TodoistSyncCommand.item_update(todoist_task)
+        if command is None:
+            logger.info(f"No changes for Todoist Task {todoist_task.content}, skipping update.")
+            continue
+        commands.append(command)
+    return commands
+
+
+def _batch_count(num_commands: int) -> int:
+    return -(-num_commands // TODOIST_SYNC_BATCH_SIZE)
+
+
+def _within_request_budget(
+    commands: List[models.TodoistSyncCommand],
+    deferrable_commands: List[models.TodoistSyncCommand],
+    reserved_requests: int = 0,
+) -> Tuple[List[models.TodoistSyncCommand], List[models.TodoistSyncCommand]]:
+    """
+    Split off the tail of `deferrable_commands` that would not fit in the remaining Todoist request budget.
+
+    Returns the commands to send and the deferred ones. Deferred commands show up again in the next run's
+    comparison, so they are postponed instead of making the run fail halfway through on the rate limit.
+    """
+    budget = rate_limit.remaining_budget(f"{TODOIST_API_BASE}/sync")
+    if budget is None:
+        return commands + deferrable_commands, []
+    available_requests = max(0, budget - reserved_requests - _batch_count(len(commands)))
+    num_deferrable = min(len(deferrable_commands), available_requests * TODOIST_SYNC_BATCH_SIZE)
+    if num_deferrable < len(deferrable_commands):
+        logger.warning(
+            f"Todoist request budget is {budget}, deferring "
+            f"{len(deferrable_commands) - num_deferrable} commands to the next run."
         )
+    return commands + deferrable_commands[:num_deferrable], deferrable_commands[num_deferrable:]
+
+
+def todoist_plan_reconciliations(
+    source: Optional[str], reconciliations: Iterable[models.Reconciliation], remove_closed: bool = False
+) -> plan.ReconciledPlan:
+    """
+    Turn a reconciliation stream into the Sync API commands that apply it, one reconciliation at a time.
+
+    With remove_closed unmatched tasks are deleted instead of completed.
+    """
+    # Scopes the uuids of new tasks, resending this plan reuses them but a later plan gets new ones
+    plan_id = uuid.uuid4().hex
+    close_command = models.TodoistSyncCommand.item_delete if remove_closed else models.TodoistSyncCommand.item_close
+    planned = {action.value: 0 for action in models.ReconcileAction}
+    reopen_commands, add_commands, deferrable_commands, unchanged = [], [], [], []
+
+    for reconciliation in reconciliations:
+        planned[reconciliation.action.value] += 1
+        todoist_task = reconciliation.task
+        if reconciliation.action is models.ReconcileAction.ADD:
+            add_commands.append(models.TodoistSyncCommand.item_add(todoist_task, plan_id))
+        elif reconciliation.action is models.ReconcileAction.REOPEN:
+            reopen_commands.append(models.TodoistSyncCommand.item_uncomplete(todoist_task))
+        elif reconciliation.action is models.ReconcileAction.UPDATE:
+            command = models.TodoistSyncCommand.item_update(todoist_task)
+            if command is None:
+                logger.info(f"No changes for Todoist Task {todoist_task.content}, skipping update.")
+                unchanged.append(todoist_task)
+            else:
+                deferrable_commands.append(command)
+        else:
+            # Closes come after all updates in the stream, so they are the first to be deferred
+            deferrable_commands.append(close_command(todoist_task))
+
+    commands, deferred = _within_request_budget(
+        add_commands, deferrable_commands, reserved_requests=_batch_count(len(reopen_commands))
+    )
+    # Reopened tasks are usually updated as well, so reopen them before the rest goes out
+    sync_plan = plan.SyncPlan(source=source, created_at=time.time(), steps=[reopen_commands, commands])
+    return plan.ReconciledPlan(sync_plan=sync_plan, planned=planned, unchanged=unchanged, deferred=deferred)
+
+
+def todoist_plan_comparison_result(
+    source: Optional[str], comparison_result: models.TaskComparisonResult, remove_closed: bool = False
+) -> plan.SyncPlan:
+    """
+    Turn a comparison result into the Sync API commands that apply it.
+
+    With remove_closed the tasks in to_close are deleted instead of completed.
+    """
+    reconciliations = itertools.chain(
+        (models.Reconciliation(models.ReconcileAction.REOPEN, task) for task in comparison_result.to_reopen),
+        (models.Reconciliation(models.ReconcileAction.ADD, task) for task in comparison_result.to_add),
+        (models.Reconciliation(models.ReconcileAction.UPDATE, task) for task in comparison_result.to_update),
+        (models.Reconciliation(models.ReconcileAction.CLOSE, task) for task in comparison_result.to_close),
+    )
+    return todoist_plan_reconciliations(source, reconciliations, remove_closed).sync_plan
+
+
+async def async_todoist_apply_plan(
+    sync_plan: plan.SyncPlan, resume: bool = False
+) -> models.TaskComparisonResult:
+    """
+    Apply a plan step by step and return what Todoist acknowledged.
+
+    A plan with a source is written to disk first and every answered batch is journaled, so an
+    interrupted apply can be resumed with todoist_resume_plan. Both files are removed once it is done.
+    Only a resumed plan skips the commands its journal has answers for.
+    """
+    journal = None
+    journaled = {}
+    if sync_plan.source is not None:
+        journal = plan.PlanJournal(plan.journal_path(sync_plan.source))
+        if resume:
+            journaled = journal.entries()
+        else:
+            plan.write_plan(sync_plan)
+
+    succeeded = []
+    for step in sync_plan.steps:
+        pending = []
+        for command in step:
+            entry = journaled.get(command.uuid)
+            if entry is None:
+                pending.append(command)
+            elif entry["ok"]:
+                command.task.id = entry["task_id"] or command.task.id
+                succeeded.append(command)
+        if len(pending) < len(step):
+            logger.info(f"Skipping {len(step) - len(pending)} Todoist commands already answered in the journal.")
+        succeeded += await async_todoist_sync_commands(pending, journal)
+
+    if sync_plan.source is not None:
+        plan.discard_plan(sync_plan.source)
+
+    return models.TaskComparisonResult(
+        to_add=_commands_to_collection(succeeded, models.TodoistSyncCommandType.ITEM_ADD),
+        to_update=_commands_to_collection(succeeded, models.TodoistSyncCommandType.ITEM_UPDATE),
+        to_close=_commands_to_collection(
+            succeeded, models.TodoistSyncCommandType.ITEM_CLOSE, models.TodoistSyncCommandType.ITEM_DELETE
+        ),
+        to_reopen=_commands_to_collection(succeeded, models.TodoistSyncCommandType.ITEM_UNCOMPLETE),
+    )
 
-        created_todoist_task = models.TodoistTask.from_response(
-            response_to_json_value(create_task_response)
-        )
-        logger.info(f"Created new Todoist Task {todoist_task.content}")
-        created[created_todoist_task.permalink] = created_todoist_task
 
-    return models.TodoistTaskCollection(*created.values())
+def todoist_apply_plan(sync_plan: plan.SyncPlan, resume: bool = False) -> models.TaskComparisonResult:
+    return run_sync(async_todoist_apply_plan(sync_plan, resume))
 
 
-def todoist_update_tasks(
+def todoist_resume_plan(source: str) -> Optional[models.TaskComparisonResult]:
+    """Finish the unfinished plan of a source, returns None when there is nothing to resume."""
+    sync_plan = plan.load_plan(source)
+    if sync_plan is None:
+        return None
+    if plan.is_plan_expired(sync_plan):
+        logger.warning(f"Discarding the unfinished plan of {source}, it is too old to be resumed.")
+        plan.discard_plan(source)
+        return None
+    logger.info(f"Resuming the unfinished plan of {source} with {len(sync_plan.commands)} commands.")
+    return todoist_apply_plan(sync_plan, resume=True)
+
+
+def todoist_apply_preview(source: str) -> models.TaskComparisonResult:
+    """Apply the plan a --plan run wrote for review, raises ValueError when there is none or it is too old."""
+    sync_plan = plan.load_preview(source)
+    if sync_plan is None:
+        raise ValueError(f"No previewed plan for {source}, run with --plan first.")
+    plan.discard_preview(source)
+    if plan.is_plan_expired(sync_plan):
+        raise ValueError(f"The previewed plan of {source} is too old to be applied, run with --plan again.")
+    logger.info(f"Applying the previewed plan of {source} with {len(sync_plan.commands)} commands.")
+    return todoist_apply_plan(sync_plan)
+
+
+async def async_todoist_apply_comparison_result(
+    comparison_result: models.TaskComparisonResult, remove_closed: bool = False
+) -> models.TaskComparisonResult:
+    """Apply a whole comparison result through the Sync API command queue, without a plan file."""
+    return await async_todoist_apply_plan(todoist_plan_comparison_result(None, comparison_result, remove_closed))
+
+
+def todoist_apply_comparison_result(
+    comparison_result: models.TaskComparisonResult, remove_closed: bool = False
+) -> models.TaskComparisonResult:
+    return run_sync(async_todoist_apply_comparison_result(comparison_result, remove_closed))
+
+
+async def async_todoist_create_tasks(
     todoist_tasks: models.TodoistTaskCollection,
 ) -> models.TodoistTaskCollection:
-    updated = {}
+    plan_id = uuid.uuid4().hex
+    succeeded = await async_todoist_sync_commands(
+        [models.TodoistSyncCommand.item_add(task, plan_id) for task in todoist_tasks]
+    )
+    return _commands_to_collection(succeeded, models.TodoistSyncCommandType.ITEM_ADD)
 
-    for todoist_task in todoist_tasks:
-        payload = todoist_task.serialize(
-            {"content", "description", "priority", "due_string"},
-            changed_only=True,
-        )
-        if not payload:
-            logger.info(f'No changes for Todoist Task {todoist_task.content}, skipping update.')
-            continue
 
-        update_task_response = requests.post(
-            f"{TODOIST_API_BASE}/tasks/{todoist_task.id}",
-            headers={
-                "Authorization": f"Bearer {config.config.todoist_access_token}",
-                "X-Request-Id": uuid.uuid4().hex,
-            },
-            json=payload,
-        )
-        update_task_response.raise_for_status()  # @TODO: or maybe load the contents?
-        logger.info(f"Updated Todoist Task {todoist_task.content}")
-        updated[todoist_task.permalink] = todoist_task
+def todoist_create_tasks(
+    todoist_tasks: models.TodoistTaskCollection,
+) -> models.TodoistTaskCollection:
+    return run_sync(async_todoist_create_tasks(todoist_tasks))
+
+
+async def async_todoist_update_tasks(
+    todoist_tasks: models.TodoistTaskCollection,
+) -> models.TodoistTaskCollection:
+    succeeded = await async_todoist_sync_commands(_update_commands(todoist_tasks))
+    return _commands_to_collection(succeeded, models.TodoistSyncCommandType.ITEM_UPDATE)
+
 
-    return models.TodoistTaskCollection(*updated.values())
+def todoist_update_tasks(
+    todoist_tasks: models.TodoistTaskCollection,
+) -> models.TodoistTaskCollection:
+    return run_sync(async_todoist_update_tasks(todoist_tasks))
+
+
+async def async_todoist_close_tasks(todoist_tasks: models.TodoistTaskCollection):
+    succeeded = await async_todoist_sync_commands(
+        [models.TodoistSyncCommand.item_close(task) for task in todoist_tasks]
+    )
+    return _commands_to_collection(succeeded, models.TodoistSyncCommandType.ITEM_CLOSE)
 
 
 def todoist_close_tasks(todist_tasks: models.TodoistTaskCollection):
-    closed = {}
+    return run_sync(async_todoist_close_tasks(todist_tasks))
 
-    for todoist_task in todist_tasks:
-        close_task_response = requests.post(
-            f"{TODOIST_API_BASE}/tasks/{todoist_task.id}/close",
-            headers={
-                "Authorization": f"Bearer {config.config.todoist_access_token}",
-                "X-Request-Id": uuid.uuid4().hex,
-            },
-        )
-        if close_task_response.status_code == http.HTTPStatus.NO_CONTENT:
-            closed[todoist_task.permalink] = todoist_task
-            logger.info(f"Closed Todoist Task {todoist_task.description}.")
 
-    return models.TodoistTaskCollection(*closed.values())
+async def async_todoist_remove_tasks(todoist_tasks: models.TodoistTaskCollection):
+    succeeded = await async_todoist_sync_commands(
+        [models.TodoistSyncCommand.item_delete(task) for task in todoist_tasks]
+    )
+    return _commands_to_collection(succeeded, models.TodoistSyncCommandType.ITEM_DELETE)
 
 
 def todoist_remove_tasks(todoist_tasks: models.TodoistTaskCollection):
-    removed = {}
+    return run_sync(async_todoist_remove_tasks(todoist_tasks))
 
-    for todoist_task in todoist_tasks:
-        remove_task_response = requests.delete(
-            f"{TODOIST_API_BASE}/tasks/{todoist_task.id}",
-            headers={
-                "Authorization": f"Bearer {config.config.todoist_access_token}",
-                "X-Request-Id": uuid.uuid4().hex,
-            },
-        )
-        if remove_task_response.status_code == http.HTTPStatus.NO_CONTENT:
-            removed[todoist_task.permalink] = todoist_task
-            logger.info(f"Removed Todoist Task {todoist_task.description}.")
 
-    return models.TodoistTaskCollection(*removed.values())
+async def async_todoist_reopen_tasks(todoist_tasks: models.TodoistTaskCollection):
+    succeeded = await async_todoist_sync_commands(
+        [models.TodoistSyncCommand.item_uncomplete(task) for task in todoist_tasks]
+    )
+    return _commands_to_collection(succeeded, models.TodoistSyncCommandType.ITEM_UNCOMPLETE)
 
 
 def todoist_reopen_tasks(todoist_tasks: models.TodoistTaskCollection):
-    reopened = {}
-
-    for todoist_task in todoist_tasks:
-        reopen_task_response = requests.post(
-            f"{TODOIST_API_BASE}/tasks/{todoist_task.id}/reopen",
-            headers={
-                "Authorization": f"Bearer {config.config.todoist_access_token}",
-                "X-Request-Id": uuid.uuid4().hex,
-            },
-        )
-        if reopen_task_response.status_code == http.HTTPStatus.NO_CONTENT:
-            reopened[todoist_task.permalink] = todoist_task
-            logger.info(f"Reopened Todoist Task {todoist_task.description}.")
-
-    return models.TodoistTaskCollection(*reopened.values())
+    return run_sync(async_todoist_reopen_tasks(todoist_tasks))
@@ -2,8 +2,12 @@ from __future__ import annotations
 
 import dataclasses
 import enum
+import functools
+import hashlib
+import json
 import re
-from typing import Dict, Iterable, List, Union, NamedTuple, Optional
+import uuid
+from typing import Dict, Iterable, Iterator, List, Tuple, Union, NamedTuple, Optional
 
 import pendulum
 
@@ -36,6 +40,12 @@ class TodoistTaskPriorityMapping(enum.IntEnum):
     P4 = 1
 
 
+@functools.lru_cache(maxsize=None)
+def default_priority() -> TodoistTaskPriorityMapping:
+    """Priority of tasks whose source sets none, looked up once from the config."""
+    return TodoistTaskPriorityMapping[config.todoist.default_priority]
+
+
 @dataclasses.dataclass
 class Due:
     date: pendulum.Date  # would be good to convert to pendulum.Date
@@ -67,7 +77,7 @@ class TodoistTask(Item):
     description: str
     project_id: str
     labels: List[str]
-    priority: int = TodoistTaskPriorityMapping[config.config.todoist_default_priority]
+    priority: int = dataclasses.field(default_factory=lambda: default_priority())
 
     # These two are only used during write
     due_string: Optional[str] = None
@@ -76,6 +86,7 @@ class TodoistTask(Item):
     # These are only used during read
     due: Optional[Due] = None
     is_completed: bool = False
+    updated_at: Optional[str] = None
 
     RE_PERMALINK = re.compile(r"https?://[^\s<>\"]+")
     RE_MARKDOWN_LINK = re.compile(r"\[.*?\]\((https?://[^\s)]+)\)")
@@ -107,20 +118,198 @@ class TodoistTask(Item):
             labels=response["labels"],
             due=due,
             is_completed=response.get("checked", False),
+            updated_at=response.get("updated_at"),
+        )
+
+    @classmethod
+    def is_hydrated_completed_response(cls, response: Dict) -> bool:
+        return all(key in response for key in ("content", "description", "project_id"))
+
+    @classmethod
+    def from_completed_response(cls, response: Dict) -> TodoistTask:
+        # Older completed payloads carry the completion record id in "id" and the task id in "task_id"
+        return cls(
+            id=response.get("task_id") or response["id"],
+            content=response["content"],
+            description=cls.normalize_description(response["description"]),
+            project_id=response["project_id"],
+            labels=response.get("labels", []),
+            due=Due.from_response(response.get("due")),
+            is_completed=True,
+            updated_at=response.get("updated_at") or response.get("completed_at"),
         )
 
+    FINGERPRINT_FIELDS = ("content", "description", "priority", "labels", "due_string")
+
+    def fingerprint(self) -> str:
+        """Hash of the fields this project pushes to Todoist."""
+        payload = {field_name: getattr(self, field_name) for field_name in self.FINGERPRINT_FIELDS}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
     def update_from_response(self, response: Dict):
         self.id = response.get("id") or self.id
         self.content = response.get("content") or self.content
         self.description = response.get("description") or self.description
 
 
+class TodoistSyncCommandType(enum.Enum):
+    ITEM_ADD = "item_add"
+    ITEM_UPDATE = "item_update"
+    ITEM_CLOSE = "item_close"
+    ITEM_DELETE = "item_delete"
+    ITEM_UNCOMPLETE = "item_uncomplete"
+
+
+# Namespace of the deterministic uuids of mutations, changing it makes every pending mutation look new
+IDEMPOTENCY_NAMESPACE = uuid.UUID("5a7c2a0e-6f1d-4b43-9a53-0c6e4d0e8b21")
+
+
+@dataclasses.dataclass
+class TodoistSyncCommand(Item):
+    """A single entry of the Sync API `commands` queue, bound to the task it mutates."""
+
+    type: TodoistSyncCommandType
+    args: Dict
+    task: TodoistTask
+    uuid: str = dataclasses.field(default_factory=lambda: uuid.uuid4().hex)
+    temp_id: Optional[str] = None
+
+    @classmethod
+    def idempotency_key(
+        cls, command_type: TodoistSyncCommandType, task: TodoistTask, args: Dict, plan_id: Optional[str] = None
+    ) -> str:
+        """
+        Command uuid derived from the task, the operation and the state it leads to, so Todoist drops a
+        resent command instead of applying it twice.
+
+        The task's last modification in Todoist is part of the key, so the same transition goes through
+        again once the task was changed in between. Tasks that are not in Todoist yet have none, they are
+        scoped to the plan the command belongs to (the current day without one). A task deleted by the
+        user is then added again by the next plan instead of being dropped as a duplicate.
+        """
+        scope = task.updated_at or plan_id or pendulum.today("UTC").to_date_string()
+        target_state = json.dumps(args, sort_keys=True, default=str)
+        return uuid.uuid5(
+            IDEMPOTENCY_NAMESPACE, f"{cls._task_identity(task)}|{command_type.value}|{target_state}|{scope}"
+        ).hex
+
+    @staticmethod
+    def _task_identity(task: TodoistTask) -> str:
+        # Tasks created in Todoist by hand have no source link in their description
+        try:
+            return task.permalink
+        except ValueError:
+            pass
+        if not isinstance(task.id, PendingValue):
+            return f"id:{task.id}"
+        return f"description:{task.description}"
+
+    @classmethod
+    def for_task(
+        cls, command_type: TodoistSyncCommandType, task: TodoistTask, args: Dict, **kwargs
+    ) -> TodoistSyncCommand:
+        return cls(
+            type=command_type,
+            args=args,
+            task=task,
+            uuid=cls.idempotency_key(command_type, task, args),
+            **kwargs,
+        )
+
+    @classmethod
+    def item_add(cls, task: TodoistTask, plan_id: Optional[str] = None) -> TodoistSyncCommand:
+        args = {
+            "content": task.content,
+            "description": task.description,
+            "project_id": task.project_id,
+            "labels": task.labels,
+            "priority": task.priority,
+        }
+        if task.due_string:
+            args["due"] = {"string": task.due_string, "lang": task.due_lang or "en"}
+        key = cls.idempotency_key(TodoistSyncCommandType.ITEM_ADD, task, args, plan_id)
+        return cls(
+            type=TodoistSyncCommandType.ITEM_ADD,
+            args=args,
+            task=task,
+            uuid=key,
+            temp_id=uuid.uuid5(IDEMPOTENCY_NAMESPACE, key).hex,
+        )
+
+    @classmethod
+    def item_update(cls, task: TodoistTask) -> Optional[TodoistSyncCommand]:
+        payload = task.serialize(
+            {"content", "description", "priority", "due_string"},
+            changed_only=True,
+        )
+        if not payload:
+            return None
+        due_string = payload.pop("due_string", None)
+        if due_string:
+            payload["due"] = {"string": due_string, "lang": task.due_lang or "en"}
+        return cls.for_task(TodoistSyncCommandType.ITEM_UPDATE, task, {"id": task.id, **payload})
+
+    @classmethod
+    def item_close(cls, task: TodoistTask) -> TodoistSyncCommand:
+        return cls.for_task(TodoistSyncCommandType.ITEM_CLOSE, task, {"id": task.id})
+
+    @classmethod
+    def item_delete(cls, task: TodoistTask) -> TodoistSyncCommand:
+        return cls.for_task(TodoistSyncCommandType.ITEM_DELETE, task, {"id": task.id})
+
+    @classmethod
+    def item_uncomplete(cls, task: TodoistTask) -> TodoistSyncCommand:
+        return cls.for_task(TodoistSyncCommandType.ITEM_UNCOMPLETE, task, {"id": task.id})
+
+    def serialize(self, only: Optional[Iterator[str]] = None, changed_only: bool = False) -> Dict:
+        data = super().serialize(only or {"type", "args", "uuid", "temp_id"}, changed_only)
+        if data.get("temp_id") is None:
+            data.pop("temp_id", None)
+        return data
+
+
+class ReconcileAction(enum.Enum):
+    ADD = "add"
+    UPDATE = "update"
+    CLOSE = "close"
+    REOPEN = "reopen"
+
+
+class Reconciliation(NamedTuple):
+    action: ReconcileAction
+    task: TodoistTask
+
+
+class ReconcilePolicy(NamedTuple):
+    # Fields copied from the expected task onto the matching Todoist task
+    update_fields: Tuple[str, ...]
+    # Reopen matching tasks that were completed in Todoist
+    reopen_completed: bool = False
+    # Delete unmatched tasks instead of completing them
+    remove_closed: bool = False
+
+
+CALENDAR_POLICY = ReconcilePolicy(
+    update_fields=("content", "description", "due_string"), remove_closed=True
+)
+HARMONOGRAM_POLICY = ReconcilePolicy(
+    update_fields=("content", "description", "priority"), remove_closed=True
+)
+GITHUB_POLICY = ReconcilePolicy(
+    update_fields=("content", "description"), reopen_completed=True
+)
+
+
 class TaskComparisonResult(NamedTuple):
     to_add: TodoistTaskCollection
     to_update: TodoistTaskCollection
     to_close: TodoistTaskCollection
     to_reopen: TodoistTaskCollection
 
+    def counts(self) -> Dict[str, int]:
+        """Number of tasks per action, keyed by the ReconcileAction values."""
+        return {field.removeprefix("to_"): len(tasks) for field, tasks in self._asdict().items()}
+
 
 class TodoistTaskCollection(Collection):
     primary_key_field_name = "description"
@@ -132,6 +321,19 @@ class TodoistTaskCollection(Collection):
     def from_response(cls, response: Iterable[Dict]) -> TodoistTaskCollection:
         return cls(*[cls.type.from_response(item) for item in response])
 
+    @classmethod
+    def iter_sync_replica(cls, items: Dict[str, Dict], todoist_project_id: str) -> Iterator[TodoistTask]:
+        """Active tasks of a project, read one at a time from the local Sync API item replica."""
+        for item in items.values():
+            if item["project_id"] == todoist_project_id and not item.get("checked"):
+                yield cls.type.from_response(item)
+
+    @classmethod
+    def from_sync_replica(
+        cls, items: Dict[str, Dict], todoist_project_id: str
+    ) -> TodoistTaskCollection:
+        return cls(*cls.iter_sync_replica(items, todoist_project_id))
+
     @classmethod
     def from_harmonogram(
         cls, collection_days: Collection, todoist_project_id: str
@@ -168,9 +370,7 @@ class TodoistTaskCollection(Collection):
             )
             due_string = f"today {due_time}"
 
-            priority = TodoistTaskPriorityMapping[
-                config.config.todoist_default_priority
-            ]
+            priority = default_priority()
             priority_match = re.search(cls.RE_PRIORITY, calendar_event.summary)
             if priority_match:
                 priority_str = priority_match.group(1).upper()
@@ -217,118 +417,48 @@ class TodoistTaskCollection(Collection):
         return cls(*tasks)
 
     @classmethod
-    def compare_calendar(
-        cls,
-        calendar_events: TodoistTaskCollection,
-        todoist_tasks: TodoistTaskCollection,
-    ) -> TaskComparisonResult:
-        to_add = TodoistTaskCollection()
-        to_update = TodoistTaskCollection()
-        to_close = TodoistTaskCollection()
-
-        for calendar_event in calendar_events:
-            if calendar_event not in todoist_tasks:
-                to_add += calendar_event
-                logger.info(f"Need to add task {calendar_event.content}.")
-
-            else:
-                todoist_task = todoist_tasks.get(description=calendar_event.description)
-                todoist_task.content = calendar_event.content
-                todoist_task.description = calendar_event.description
-                todoist_task.due_string = calendar_event.due_string
-                to_update += todoist_task
-                logger.info(f"Need to update task {calendar_event.content}.")
-
-        for todoist_task in todoist_tasks:
-            if (todoist_task not in to_add) and (todoist_task not in to_update):
-                to_close += todoist_task
-                logger.info(f"Need to remove task {todoist_task.content}.")
-
-        return TaskComparisonResult(
-            to_add=to_add,
-            to_update=to_update,
-            to_close=to_close,
-            to_reopen=TodoistTaskCollection(),
-        )
-
-    @classmethod
-    def compare_harmonogram(
+    def reconcile(
         cls,
-        harmonogram_tasks: TodoistTaskCollection,
-        todoist_tasks: TodoistTaskCollection,
-    ) -> TaskComparisonResult:
-        to_add = TodoistTaskCollection()
-        to_update = TodoistTaskCollection()
-        to_close = TodoistTaskCollection()
-
-        for harmonogram_task in harmonogram_tasks:
-            if harmonogram_task not in todoist_tasks:
-                to_add += harmonogram_task
-                logger.info(
-                    f"Need to add task {harmonogram_task.content} on {harmonogram_task.due_string}."
-                )
-
-            else:
-                todoist_task = todoist_tasks.get(
-                    description=harmonogram_task.description
-                )
-                todoist_task.content = harmonogram_task.content
-                todoist_task.description = harmonogram_task.description
-                todoist_task.priority = TodoistTaskPriorityMapping.P1.value
-                to_update += todoist_task
-                logger.info(
-                    f"Need to update task {harmonogram_task.content} on {harmonogram_task.due_string}."
-                )
-
-        for todoist_task in todoist_tasks:
-            if (todoist_task not in to_add) and (todoist_task not in to_update):
-                to_close += todoist_task
-                logger.info(
-                    f"Need to remove task {todoist_task.content} on {todoist_task.due.date}."
-                )
-
-        return TaskComparisonResult(
-            to_add=to_add,
-            to_update=to_update,
-            to_close=to_close,
-            to_reopen=TodoistTaskCollection(),
-        )
-
-    @classmethod
-    def compare_github(
-        cls, github_tasks: TodoistTaskCollection, todoist_tasks: TodoistTaskCollection
-    ) -> TaskComparisonResult:
-        to_add = TodoistTaskCollection()
-        to_update = TodoistTaskCollection()
-        to_close = TodoistTaskCollection()
-        to_reopen = TodoistTaskCollection()
-
-        for github_task in github_tasks:
-            if github_task not in todoist_tasks:
-                to_add += github_task
-                logger.info(f"Need to add task {github_task.content}.")
-
-            else:
-                todoist_task = todoist_tasks.get(description=github_task.description)
-
-                # If the task is completed but still in GitHub, it needs to be reopened
-                if todoist_task.is_completed:
-                    to_reopen += todoist_task
-                    logger.info(f"Need to reopen task {github_task.content}.")
-
-                todoist_task.content = github_task.content
-                todoist_task.description = github_task.description
-                to_update += todoist_task
-                logger.info(f"Need to update task {github_task.content}.")
-
-        for todoist_task in todoist_tasks:
-            if (todoist_task not in to_add) and (todoist_task not in to_update):
-                to_close += todoist_task
-                logger.info(f"Need to close task {todoist_task.content}.")
-
-        return TaskComparisonResult(
-            to_add=to_add, to_update=to_update, to_close=to_close, to_reopen=to_reopen
-        )
+        expected_tasks: Iterable[TodoistTask],
+        actual_tasks: Iterable[TodoistTask],
+        policy: ReconcilePolicy,
+    ) -> Iterator[Reconciliation]:
+        """
+        Stream the actions that bring the actual Todoist tasks in line with the expected ones.
+
+        Only the actual side is held, as a dict keyed by permalink; of tasks sharing one, the last wins. The
+        expected side is consumed lazily and every action is yielded as soon as it is known. Tasks left
+        unmatched are closed at the end.
+        """
+        unmatched = {todoist_task.description: todoist_task for todoist_task in actual_tasks}
+        logger.info(f"Reconciling against {len(unmatched)} Todoist tasks.")
+        seen = set()
+        close_verb = "remove" if policy.remove_closed else "close"
+
+        for expected_task in expected_tasks:
+            if expected_task.description in seen:
+                continue
+            seen.add(expected_task.description)
+
+            todoist_task = unmatched.pop(expected_task.description, None)
+            if todoist_task is None:
+                logger.info(f"Need to add task {expected_task.content}.")
+                yield Reconciliation(ReconcileAction.ADD, expected_task)
+                continue
+
+            # If the task is completed but still expected, it may need to be reopened
+            if policy.reopen_completed and todoist_task.is_completed:
+                logger.info(f"Need to reopen task {expected_task.content}.")
+                yield Reconciliation(ReconcileAction.REOPEN, todoist_task)
+
+            for field_name in policy.update_fields:
+                setattr(todoist_task, field_name, getattr(expected_task, field_name))
+            logger.info(f"Need to update task {expected_task.content}.")
+            yield Reconciliation(ReconcileAction.UPDATE, todoist_task)
+
+        for todoist_task in unmatched.values():
+            logger.info(f"Need to {close_verb} task {todoist_task.content}.")
+            yield Reconciliation(ReconcileAction.CLOSE, todoist_task)
 
 
 @dataclasses.dataclass
@@ -341,7 +471,6 @@ class TodoistLabel(Item):
         return cls(id=response["id"], name=response["name"])
 
 
-@dataclasses.dataclass
 class TodoistLabelCollection(Collection):
     type = TodoistLabel
 
@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from wrike_todoist import config
+from wrike_todoist.todoist import models
+
+logger = logging.getLogger(__name__)
+
+
+PLAN_MAX_AGE = 60 * 60  # seconds, older unfinished plans are discarded instead of resumed
+PLAN_TASK_FIELDS = {
+    "id",
+    "content",
+    "description",
+    "project_id",
+    "labels",
+    "priority",
+    "due_string",
+    "due_lang",
+    "is_completed",
+    "updated_at",
+}
+
+
+class SyncPlan(NamedTuple):
+    """Todoist mutations computed for a source, ready to be reviewed or applied."""
+
+    source: Optional[str]
+    created_at: float
+    # Steps are applied one after another, the commands within a step are sent concurrently
+    steps: List[List[models.TodoistSyncCommand]]
+
+    @property
+    def commands(self) -> List[models.TodoistSyncCommand]:
+        return [command for step in self.steps for command in step]
+
+    def request_cost(self, batch_size: int) -> int:
+        """Number of Sync API requests needed to apply the plan."""
+        return sum(-(-len(step) // batch_size) for step in self.steps)
+
+    def describe(self, batch_size: int) -> List[str]:
+        lines = [
+            f"Plan for {self.source}: {len(self.commands)} commands, "
+            f"{self.request_cost(batch_size)} Sync API requests."
+        ]
+        for command in self.commands:
+            lines.append(f"  {command.type.value:<16} {command.task.description}  {command.task.content}")
+        return lines
+
+    def serialize(self) -> Dict:
+        return {
+            "source": self.source,
+            "created_at": self.created_at,
+            "steps": [
+                [{**command.serialize(), "task": command.task.serialize(PLAN_TASK_FIELDS)} for command in step]
+                for step in self.steps
+            ],
+        }
+
+    @classmethod
+    def from_serialized(cls, data: Dict) -> "SyncPlan":
+        steps = []
+        for step in data["steps"]:
+            commands = []
+            for command in step:
+                task_data = {"id": models.PendingValue(), **command["task"]}
+                commands.append(
+                    models.TodoistSyncCommand(
+                        type=models.TodoistSyncCommandType(command["type"]),
+                        args=command["args"],
+                        task=models.TodoistTask(**task_data),
+                        uuid=command["uuid"],
+                        temp_id=command.get("temp_id"),
+                    )
+                )
+            steps.append(commands)
+        return cls(source=data["source"], created_at=data["created_at"], steps=steps)
+
+
+class ReconciledPlan(NamedTuple):
+    """Plan built from a reconciliation stream, with what is needed to record the sync afterwards."""
+
+    sync_plan: SyncPlan
+    # Reconciliations per action, updates without changes included
+    planned: Dict[str, int]
+    # Matched tasks that already look like their source item, they get no command
+    unchanged: List[models.TodoistTask]
+    # Commands that did not fit in the request budget
+    deferred: List[models.TodoistSyncCommand]
+
+
+def plan_path(source: str) -> str:
+    return os.path.join(config.config.cache_dir, "plans", f"{source}.json")
+
+
+def journal_path(source: str) -> str:
+    return os.path.join(config.config.cache_dir, "plans", f"{source}.journal")
+
+
+def preview_path(source: str) -> str:
+    return os.path.join(config.config.cache_dir, "plans", f"{source}.preview.json")
+
+
+def _write(path: str, sync_plan: SyncPlan):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(sync_plan.serialize(), file)
+    os.replace(temporary_path, path)
+
+
+def _load(path: str, source: str) -> Optional[SyncPlan]:
+    try:
+        with open(path, encoding="utf-8") as file:
+            return SyncPlan.from_serialized(json.load(file))
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError):
+        logger.warning(f"Unreadable plan for {source} in {path}, discarding it.")
+        _remove(path)
+        return None
+
+
+def _remove(*paths: str):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def write_plan(sync_plan: SyncPlan):
+    """Write the plan that is about to be applied, dropping the journal of any earlier plan."""
+    # Command uuids are deterministic, so an old journal could mark commands of this plan as answered
+    _remove(journal_path(sync_plan.source))
+    _write(plan_path(sync_plan.source), sync_plan)
+
+
+def load_plan(source: str) -> Optional[SyncPlan]:
+    sync_plan = _load(plan_path(source), source)
+    if sync_plan is None:
+        _remove(journal_path(source))
+    return sync_plan
+
+
+def discard_plan(source: str):
+    _remove(plan_path(source), journal_path(source))
+
+
+def write_preview(sync_plan: SyncPlan):
+    """Write a plan for review, it is only applied on request and never resumed on its own."""
+    _write(preview_path(sync_plan.source), sync_plan)
+
+
+def load_preview(source: str) -> Optional[SyncPlan]:
+    return _load(preview_path(source), source)
+
+
+def discard_preview(source: str):
+    _remove(preview_path(source))
+
+
+def is_plan_expired(sync_plan: SyncPlan) -> bool:
+    return time.time() - sync_plan.created_at > PLAN_MAX_AGE
+
+
+class PlanJournal:
+    """
+    Append-only record of the plan commands Todoist has answered for.
+
+    Every answered batch is flushed to disk before the next one goes out, so an interrupted apply
+    resumes with the commands that were not sent yet.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def entries(self) -> Dict[str, Dict]:
+        entries = {}
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line torn by the interruption, its batch is sent again
+                    entries[entry["uuid"]] = entry
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def record(self, batch: List[models.TodoistSyncCommand], succeeded: List[models.TodoistSyncCommand]):
+        succeeded_uuids = {command.uuid for command in succeeded}
+        lines = [
+            json.dumps(
+                {
+                    "uuid": command.uuid,
+                    "ok": command.uuid in succeeded_uuids,
+                    "task_id": None if isinstance(command.task.id, models.PendingValue) else command.task.id,
+                }
+            )
+            + "\n"
+            for command in batch
+        ]
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.writelines(lines)
+            file.flush()
+            os.fsync(file.fileno())
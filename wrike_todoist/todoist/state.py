@@ -0,0 +1,159 @@
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, NamedTuple, Optional
+
+from wrike_todoist import config
+from wrike_todoist.todoist import models, plan
+
+logger = logging.getLogger(__name__)
+
+
+class TaskState(NamedTuple):
+    source_key: str
+    todoist_task_id: str
+    fingerprint: str
+
+
+class StateStore:
+    """
+    SQLite store mapping each source item (by permalink) to its Todoist task id and the fingerprint of the
+    fields last pushed, plus when each source was last verified against Todoist.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS task_state (
+        source TEXT NOT NULL,
+        source_key TEXT NOT NULL,
+        todoist_task_id TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        PRIMARY KEY (source, source_key)
+    );
+    CREATE TABLE IF NOT EXISTS source_state (
+        source TEXT PRIMARY KEY,
+        verified_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.connect() as connection:
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(task_state)")}
+            if "is_completed" in columns:
+                # Stores written before the column was dropped are rebuilt by diffing every source again
+                connection.executescript("DROP TABLE task_state; DROP TABLE IF EXISTS source_state;")
+            connection.executescript(self.SCHEMA)
+
+    @contextlib.contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        # A connection per operation keeps the store safe to use from concurrently running pipelines
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def tasks(self, source: str) -> Dict[str, TaskState]:
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT source_key, todoist_task_id, fingerprint FROM task_state WHERE source = ?", (source,)
+            ).fetchall()
+        return {row[0]: TaskState(*row) for row in rows}
+
+    def verified_at(self, source: str) -> Optional[float]:
+        with self.connect() as connection:
+            row = connection.execute("SELECT verified_at FROM source_state WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def forget(self, source: str):
+        """Drop the verification mark of a source, so the next run diffs it against Todoist again."""
+        with self.connect() as connection:
+            connection.execute("DELETE FROM source_state WHERE source = ?", (source,))
+
+    def replace(self, source: str, task_states: Dict[str, TaskState]):
+        """Replace the whole state of a source after it was verified against Todoist."""
+        with self.connect() as connection:
+            connection.execute("DELETE FROM task_state WHERE source = ?", (source,))
+            connection.executemany(
+                "INSERT INTO task_state (source, source_key, todoist_task_id, fingerprint) VALUES (?, ?, ?, ?)",
+                [(source, *state) for state in task_states.values()],
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO source_state (source, verified_at) VALUES (?, ?)",
+                (source, time.time()),
+            )
+
+
+_state_store: Optional[StateStore] = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store() -> StateStore:
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            _state_store = StateStore(os.path.join(config.config.cache_dir, "state.sqlite3"))
+        return _state_store
+
+
+def is_in_sync(source: str, expected_tasks: models.TodoistTaskCollection) -> bool:
+    """
+    True when the expected tasks match what was last pushed for this source and the source was verified
+    against Todoist within `state_verify_interval`, i.e. the Todoist reads and the diff can be skipped.
+
+    The skip is all-or-nothing per source and only looks at the source side: edits made in Todoist itself
+    (completing, editing or deleting a synced task) go unnoticed until the next verification.
+    """
+    store = get_state_store()
+    verified_at = store.verified_at(source)
+    if verified_at is None or time.time() - verified_at > config.config.state_verify_interval:
+        return False
+
+    task_states = store.tasks(source)
+    expected_fingerprints = {task.description: task.fingerprint() for task in expected_tasks}
+    return expected_fingerprints == {key: state.fingerprint for key, state in task_states.items()}
+
+
+def record_sync(
+    source: str,
+    expected_tasks: models.TodoistTaskCollection,
+    reconciled: plan.ReconciledPlan,
+    applied: models.TaskComparisonResult,
+):
+    """Store the state of a source after the plan reconciled against Todoist was applied."""
+    expected_fingerprints = {task.description: task.fingerprint() for task in expected_tasks}
+    commands = [*reconciled.sync_plan.commands, *reconciled.deferred]
+    task_states = {}
+
+    matched = [(todoist_task, True) for todoist_task in reconciled.unchanged] + [
+        (command.task, command.task in applied.to_update)
+        for command in commands
+        if command.type is models.TodoistSyncCommandType.ITEM_UPDATE
+    ]
+    for todoist_task, is_pushed in matched:
+        task_states[todoist_task.description] = TaskState(
+            source_key=todoist_task.description,
+            todoist_task_id=todoist_task.id,
+            # A rejected or deferred update gets no fingerprint, so the next run notices the drift
+            fingerprint=expected_fingerprints[todoist_task.description] if is_pushed else "",
+        )
+    for todoist_task in applied.to_add:
+        task_states[todoist_task.description] = TaskState(
+            source_key=todoist_task.description,
+            todoist_task_id=todoist_task.id,
+            fingerprint=expected_fingerprints[todoist_task.description],
+        )
+
+    get_state_store().replace(source, task_states)
+    logger.info(f"Recorded state of {len(task_states)} {source} tasks.")
+
+    # Tasks that stayed open are not part of the stored state, so only another diff can close them
+    close_types = {models.TodoistSyncCommandType.ITEM_CLOSE, models.TodoistSyncCommandType.ITEM_DELETE}
+    if any(command.type in close_types and command.task not in applied.to_close for command in commands):
+        get_state_store().forget(source)
+        logger.info(f"Not all {source} tasks were closed, {source} will be verified again on the next run.")
@@ -0,0 +1,62 @@
+import contextlib
+import logging
+from typing import Dict, Iterator
+
+import sentry_sdk
+from sentry_sdk.tracing import Span
+
+from wrike_todoist import config
+
+logger = logging.getLogger(__name__)
+
+
+def init():
+    """
+    Start the Sentry client when a DSN is configured, sampling traces at SENTRY_TRACES_SAMPLE_RATE.
+
+    Outbound HTTP calls get their spans from the SDK's default stdlib integration, which sees the requests
+    and the Google client alike. Trace headers are not propagated, none of the upstreams is ours.
+    Only the Sentry settings are read here, and no error escapes: tracing must never stop the pipelines.
+    """
+    try:
+        settings = config.sentry
+        if not settings.dsn:
+            return
+        sentry_sdk.init(
+            dsn=settings.dsn,
+            traces_sample_rate=settings.traces_sample_rate,
+            trace_propagation_targets=[],
+        )
+    except Exception:
+        logger.exception("Failed to set up Sentry, tracing is disabled.")
+        return
+    logger.info(f"Sentry tracing enabled, sampling {settings.traces_sample_rate:.0%} of pipeline runs.")
+
+
+@contextlib.contextmanager
+def transaction(pipeline: str) -> Iterator[Span]:
+    """Transaction of one pipeline run, in its own isolation scope so concurrent pipelines stay apart."""
+    with sentry_sdk.isolation_scope() as scope:
+        scope.set_tag("pipeline", pipeline)
+        with sentry_sdk.start_transaction(op="pipeline", name=pipeline) as pipeline_transaction:
+            yield pipeline_transaction
+
+
+@contextlib.contextmanager
+def span(op: str, name: str, **data) -> Iterator[Span]:
+    """
+    Child span of the current span, with `data` attached.
+
+    The span is opened in a forked scope. Tasks gathered by asyncio share their parent's scope, so
+    sibling spans would otherwise become each other's parents.
+    """
+    with sentry_sdk.new_scope(), sentry_sdk.start_span(op=op, name=name) as current:
+        for key, value in data.items():
+            current.set_data(key, value)
+        yield current
+
+
+def set_counts(current: Span, counts: Dict[str, int]):
+    """Attach the number of tasks per action to a span."""
+    for action, count in counts.items():
+        current.set_data(action, count)